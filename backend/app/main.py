@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.responses import ORJSONResponse
 from app.routers import health, model, ws
 
-app = FastAPI(title="agent-cad", version="0.1.0")
+app = FastAPI(
+    title="agent-cad",
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
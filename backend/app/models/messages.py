@@ -1,90 +1,51 @@
 from typing import Literal
 
+import msgspec
 from pydantic import BaseModel
 
 
 # --- WebSocket message models ---
+# Tagged on the "type" field so a WSMessage union decodes in one pass.
 
-class ChatMessage(BaseModel):
-    type: Literal["chat"] = "chat"
+class ChatMessage(msgspec.Struct, tag_field="type", tag="chat"):
     role: Literal["user", "assistant"]
     content: str
 
 
-class CadUpdateMessage(BaseModel):
-    type: Literal["cad_update"] = "cad_update"
-    vertices: list[float] = []
-    faces: list[int] = []
-    normals: list[float] = []
-    metadata: dict | None = None
+class ChatDeltaMessage(msgspec.Struct, tag_field="type", tag="chat_delta"):
+    text: str  # incremental assistant text, superseded by the final ChatMessage
 
 
-class DrawingMessage(BaseModel):
-    type: Literal["drawing"] = "drawing"
+class DrawingMessage(msgspec.Struct, tag_field="type", tag="drawing"):
     points: list[dict] = []
     action: Literal["start", "move", "end"] = "start"
 
 
-class SystemMessage(BaseModel):
-    type: Literal["system"] = "system"
+class SystemMessage(msgspec.Struct, tag_field="type", tag="system"):
     content: str
 
 
-class CadCommandMessage(BaseModel):
-    type: Literal["cad_command"] = "cad_command"
-    action: str  # select_faces | clear_selection | create_feature | delete_feature | set_display
+class CadCommandMessage(msgspec.Struct, tag_field="type", tag="cad_command", omit_defaults=True):
+    action: str  # select_faces | clear_selection | create_feature | delete_feature | set_display | set_view
     face_ids: list[int] | None = None
+    replace: bool | None = None  # select_faces: replace rather than add to the selection
     name: str | None = None
     xray: bool | None = None
     wireframe: bool | None = None
     colors: bool | None = None
     clip_plane: str | None = None
     fit_all: bool | None = None
+    view: str | None = None
+    zoom: float | None = None
+    id: str | None = None  # set_view: request id to acknowledge once rendered
 
 
-WSMessage = ChatMessage | CadUpdateMessage | DrawingMessage | SystemMessage | CadCommandMessage
+# cad_update is not a JSON message: the server sends it as a binary mesh
+# frame (see services/mesh_codec.py)
+WSMessage = ChatMessage | ChatDeltaMessage | DrawingMessage | SystemMessage | CadCommandMessage
 
 
-# --- CAD model data models ---
-
-class FaceMetadata(BaseModel):
-    id: int
-    surface_type: str
-    area: float
-    centroid: list[float]
-    normal: list[float]
-    bounds: list[float]
-    radius: float | None = None
-    axis_direction: list[float] | None = None
-    axis_point: list[float] | None = None
-    arc_angle: float | None = None
-    step_name: str | None = None
-
-
-class MeshData(BaseModel):
-    vertices: list[float]
-    normals: list[float]
-    triangles: list[int]
-    face_ids: list[int]
-    num_faces: int
-    edges: list[float]
-
-
-class ModelInfo(BaseModel):
-    num_faces: int
-    num_step_entities: int
-    length_unit: str
-    length_scale: float
-
-
-class UploadResponse(BaseModel):
-    success: bool
-    info: ModelInfo | None = None
-    mesh: MeshData | None = None
-    faces: list[FaceMetadata] | None = None
-    filename: str | None = None
-    error: str | None = None
-
+# --- REST request bodies (validated by FastAPI) ---
 
 class FeatureMember(BaseModel):
     face_id: int
@@ -96,5 +57,9 @@ class Feature(BaseModel):
     faces: list[FeatureMember]
 
 
+class FeaturesPayload(BaseModel):
+    features: dict[str, Feature] = {}
+
+
 class ExportRequest(BaseModel):
     features: dict[str, list[FeatureMember]]
@@ -1,30 +1,79 @@
 import asyncio
-import base64
 import tempfile
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Literal
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import pybase64
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request
 from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
 
-from ..models.messages import (
-    FaceMetadata, MeshData, ModelInfo, UploadResponse, ExportRequest,
-)
-from ..services.cad_engine import CadEngine
+from ..models.messages import CadCommandMessage, ExportRequest, FeaturesPayload
+from ..responses import ORJSONResponse
+from ..services.cad_engine import SURFACE_TYPE_CODES, CadEngine
+from ..services.mesh_codec import FRAME_MEDIA_TYPE, encode_frame, encode_mesh_message
+from ..ws_bus import broadcast, connected_clients, encode_message
 
-router = APIRouter(prefix="/api", tags=["model"])
+router = APIRouter(prefix="/api", tags=["model"], default_response_class=ORJSONResponse)
 
 # Single global engine instance (matches steplabeler pattern)
 engine = CadEngine()
 
-# Screenshot handshake state
-_screenshot_data: bytes | None = None
-_screenshot_event: asyncio.Event | None = None
+# OCCT work runs on one dedicated thread, off the event loop. A process pool
+# isn't an option: the loaded shapes live in this process and can't be
+# pickled. A single worker also runs jobs one at a time, in submission order,
+# so uploads and exports never interleave on the shared engine.
+cad_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cad")
 
 
-@router.post("/upload", response_model=UploadResponse)
+async def run_cad(fn, *args):
+    """Run ``fn(*args)`` on the CAD worker thread."""
+    return await asyncio.get_running_loop().run_in_executor(cad_executor, fn, *args)
+
+
+def _load_model(path: Path) -> tuple[dict, dict, list[dict]]:
+    """Load, tessellate and collect face metadata as one CAD job."""
+    info = engine.load_step(path)
+    mesh = engine.tessellate()
+    return info, mesh, engine.get_faces_metadata()
+
+# Static commands are encoded once at import
+_CLEAR_SELECTION = encode_message(CadCommandMessage(action="clear_selection"))
+
+# ETags combine this per-process token with the engine's model version, so
+# a restarted server never revalidates a client's stale copy
+_ETAG_PREFIX = uuid.uuid4().hex[:8]
+
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Screenshot requests awaiting a browser reply, keyed by request id; each
+# resolves to the image bytes and their media type
+_pending_screenshots: dict[str, asyncio.Future[tuple[bytes, str]]] = {}
+
+# Encodings the browser may capture screenshots in. The canvas encodes them
+# itself; browsers that can't produce WebP fall back to PNG, so callers must
+# honour the response's Content-Type rather than the format they asked for.
+ScreenshotFormat = Literal["png", "webp"]
+SCREENSHOT_MEDIA_TYPES = frozenset({"image/png", "image/webp"})
+
+# View changes awaiting a browser render acknowledgement, keyed by request id
+_pending_views: dict[str, asyncio.Future[None]] = {}
+
+# Upper bound on waiting for a browser to render a new camera view
+VIEW_ACK_TIMEOUT = 2.0
+
+
+@router.post("/upload", responses={200: {"content": {FRAME_MEDIA_TYPE: {}}}})
 async def upload_step(file: UploadFile = File(...)):
-    """Upload a STEP file, tessellate, and return mesh + metadata."""
+    """Upload a STEP file, tessellate, and return mesh + metadata.
+
+    On success the body is a binary mesh frame (see ``mesh_codec``); on
+    failure it is a JSON ``{"success": false, "error": ...}`` object.
+    """
     if not file.filename:
         raise HTTPException(400, "No file provided")
 
@@ -32,47 +81,94 @@ async def upload_step(file: UploadFile = File(...)):
     if suffix not in (".step", ".stp"):
         raise HTTPException(400, f"Unsupported file type: {suffix}")
 
-    # Save to temp directory
+    # Stream to a temp directory in chunks rather than reading the whole file
     tmp_dir = Path(tempfile.mkdtemp())
     tmp_path = tmp_dir / file.filename
-    content = await file.read()
-    tmp_path.write_bytes(content)
+    with tmp_path.open("wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
 
     try:
-        info_dict = engine.load_step(tmp_path)
-        mesh_dict = engine.tessellate()
-        faces_list = engine.get_faces_metadata()
-
-        response = UploadResponse(
-            success=True,
-            info=ModelInfo(**info_dict),
-            mesh=MeshData(**mesh_dict),
-            faces=[FaceMetadata(**f) for f in faces_list],
-            filename=file.filename,
-        )
+        # OCCT work is CPU-heavy; run it off the event loop so WebSocket traffic keeps flowing
+        info_dict, mesh_dict, faces_list = await run_cad(_load_model, tmp_path)
 
-        # Broadcast to all connected WebSocket clients so the viewer updates
-        from .ws import broadcast
-        await broadcast({
+        # Mesh buffers travel as raw float32/uint32 in a binary frame; the same
+        # frame is the HTTP response and the WebSocket broadcast.
+        frame = encode_mesh_message({
             "type": "cad_update",
-            "mesh": mesh_dict,
+            "success": True,
             "faces": faces_list,
             "info": info_dict,
             "filename": file.filename,
-        })
+        }, mesh_dict)
 
-        return response
+        # Broadcast to all connected WebSocket clients so the viewer updates
+        await broadcast(frame)
+
+        return Response(content=frame, media_type=FRAME_MEDIA_TYPE)
     except Exception as e:
-        return UploadResponse(success=False, error=str(e))
+        return ORJSONResponse({"success": False, "error": str(e)})
 
 
 @router.get("/faces")
-async def get_faces():
-    """Return face metadata array."""
+async def get_faces(
+    request: Request,
+    surface_type: str | None = None,
+    min_area: float | None = None,
+    max_area: float | None = None,
+    limit: int | None = Query(None, ge=0),
+):
+    """Return face metadata array, optionally filtered.
+
+    With no filters this is every face. Filters are ANDed; ``total_matching``
+    counts matches before ``limit`` is applied.
+
+    Carries a weak ETag tied to the loaded model and, when any filter or
+    ``limit`` is given, to those query values. A request gets an empty 304
+    only if its If-None-Match was issued for the same query against the
+    same model.
+    """
+    # Read the version before the faces: if a load swaps them in between,
+    # the stale tag just costs the client one extra refetch
+    etag = f"{_ETAG_PREFIX}-{engine.model_version}"
+    filtered = bool(surface_type) or min_area is not None or max_area is not None
+    if filtered or limit is not None:
+        # Each filtered view is its own representation, so tag it by query
+        query = f"{surface_type or ''}|{min_area}|{max_area}|{limit}"
+        etag += f"-{zlib.crc32(query.encode()):08x}"
+    etag = f'W/"{etag}"'
     meta = engine.get_faces_metadata()
     if not meta:
         raise HTTPException(404, "No model loaded")
-    return {"faces": meta}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if filtered:
+        meta = engine.query_faces(surface_type=surface_type, min_area=min_area, max_area=max_area)
+    total = len(meta)
+    if limit is not None:
+        meta = meta[:limit]
+    return ORJSONResponse(
+        {"faces": meta, "total_matching": total, "truncated": total > len(meta)},
+        headers={"ETag": etag},
+    )
+
+
+@router.get("/faces/soa", responses={200: {"content": {FRAME_MEDIA_TYPE: {}}}})
+async def get_faces_soa():
+    """Return face metadata as typed arrays in a binary frame.
+
+    Buffers: ids (u32), area (f32), centroids and normals (f32, N x 3),
+    surface_type (u8 codes indexing the header's ``surface_types`` list).
+    """
+    if not engine.get_faces_metadata():
+        raise HTTPException(404, "No model loaded")
+    soa = engine.get_faces_soa()
+    frame = encode_frame(
+        {"num_faces": len(soa["ids"]), "surface_types": list(SURFACE_TYPE_CODES)},
+        soa,
+    )
+    return Response(content=frame, media_type=FRAME_MEDIA_TYPE)
 
 
 @router.get("/face/{face_id}")
@@ -85,9 +181,9 @@ async def get_face(face_id: int):
 
 
 @router.post("/features")
-async def save_features(data: dict):
+async def save_features(data: FeaturesPayload):
     """Save feature definitions."""
-    engine.features = data.get("features", {})
+    engine.features = data.model_dump()["features"]
     return {"success": True}
 
 
@@ -98,46 +194,90 @@ async def get_features():
 
 
 class ScreenshotPayload(BaseModel):
-    image: str  # data:image/png;base64,... URL
-
-
-@router.get("/screenshot")
-async def get_screenshot():
-    """Request a screenshot from the browser and return PNG bytes."""
-    global _screenshot_data, _screenshot_event
-    _screenshot_data = None
-    _screenshot_event = asyncio.Event()
+    id: str  # request id from the screenshot_request message
+    image: str  # data:image/png;base64,... URL (or image/webp)
+
+
+def _resolve_screenshot(request_id: str, data: bytes, media_type: str) -> None:
+    """Hand screenshot bytes to the GET request waiting on ``request_id``."""
+    if media_type not in SCREENSHOT_MEDIA_TYPES:
+        raise HTTPException(415, f"Unsupported screenshot type: {media_type}")
+    fut = _pending_screenshots.get(request_id)
+    if fut is None:
+        raise HTTPException(404, "Unknown or expired screenshot request")
+    # Several browsers may answer the same request; the first reply wins
+    if not fut.done():
+        fut.set_result((data, media_type))
+
+
+@router.get("/screenshot", responses={200: {"content": {"image/png": {}, "image/webp": {}}}})
+async def get_screenshot(
+    format: ScreenshotFormat = "png",
+    quality: float = Query(0.85, gt=0, le=1),
+):
+    """Request a screenshot from the browser.
+
+    ``format=webp`` is several times smaller than PNG for shaded CAD views;
+    ``quality`` only applies to it. The Content-Type reports what the browser
+    actually produced.
+    """
+    data, media_type = await _capture_screenshot(format, quality)
+    return Response(content=data, media_type=media_type)
+
+
+async def _capture_screenshot(
+    format: ScreenshotFormat = "png", quality: float = 0.85,
+) -> tuple[bytes, str]:
+    """Ask connected browsers for a canvas capture and wait for the first reply."""
+    request_id = uuid.uuid4().hex
+    fut = asyncio.get_running_loop().create_future()
+    _pending_screenshots[request_id] = fut
 
-    # Ask all connected browsers to capture their canvas
-    from .ws import broadcast
-    await broadcast({"type": "screenshot_request"})
-
-    # Wait for the browser to POST back the image
     try:
-        await asyncio.wait_for(_screenshot_event.wait(), timeout=5.0)
-    except asyncio.TimeoutError:
-        raise HTTPException(504, "Screenshot capture timed out — is the browser open?")
+        # Ask all connected browsers to capture their canvas
+        await broadcast({
+            "type": "screenshot_request",
+            "id": request_id,
+            "format": format,
+            "quality": quality,
+        })
 
-    if _screenshot_data is None:
-        raise HTTPException(500, "Screenshot data was not received")
+        # Wait for a browser to POST back the image tagged with our id
+        try:
+            data = await asyncio.wait_for(fut, timeout=5.0)
+        except asyncio.TimeoutError:
+            raise HTTPException(504, "Screenshot capture timed out — is the browser open?")
+    finally:
+        _pending_screenshots.pop(request_id, None)
 
-    return Response(content=_screenshot_data, media_type="image/png")
+    return data
 
 
 @router.post("/screenshot")
 async def post_screenshot(payload: ScreenshotPayload):
     """Receive a screenshot from the browser (base64 data URL)."""
-    global _screenshot_data, _screenshot_event
-
-    # Strip the data URL prefix: "data:image/png;base64,..."
-    header, _, b64 = payload.image.partition(",")
-    if not b64:
+    # Strip the data URL prefix: "data:image/png;base64,..." — the comma is
+    # always near the start, so bound the search instead of scanning the payload
+    idx = payload.image.find(",", 0, 64)
+    if idx < 0 or idx == len(payload.image) - 1 or not payload.image.startswith("data:"):
         raise HTTPException(400, "Invalid image data URL")
+    media_type = payload.image[5:idx].partition(";")[0]
+
+    _resolve_screenshot(
+        payload.id, pybase64.b64decode(payload.image[idx + 1:], validate=False), media_type,
+    )
+    return {"success": True}
+
 
-    _screenshot_data = base64.b64decode(b64)
-    if _screenshot_event is not None:
-        _screenshot_event.set()
+@router.post("/screenshot/binary")
+async def post_screenshot_binary(request: Request, request_id: str = Query(alias="id")):
+    """Receive a screenshot from the browser as a raw image body."""
+    data = await request.body()
+    if not data:
+        raise HTTPException(400, "Empty screenshot body")
 
+    media_type = request.headers.get("content-type", "image/png").partition(";")[0].strip()
+    _resolve_screenshot(request_id, data, media_type)
     return {"success": True}
 
 
@@ -148,15 +288,61 @@ class ViewRequest(BaseModel):
 
 @router.post("/view")
 async def set_view(request: ViewRequest):
-    """Set the camera view orientation in the 3D viewer."""
-    from .ws import broadcast
-    await broadcast({
-        "type": "cad_command",
-        "action": "set_view",
-        "view": request.view,
-        "zoom": request.zoom,
-    })
-    return {"success": True, "view": request.view, "zoom": request.zoom}
+    """Set the camera view orientation in the 3D viewer.
+
+    Returns once a browser acknowledges it has rendered the new view, or
+    after ``VIEW_ACK_TIMEOUT``; ``rendered`` says which.
+    """
+    rendered = await _apply_view(request.view, request.zoom)
+    return {"success": True, "view": request.view, "zoom": request.zoom, "rendered": rendered}
+
+
+@router.post("/view-and-capture", responses={200: {"content": {"image/png": {}, "image/webp": {}}}})
+async def view_and_capture(
+    request: ViewRequest,
+    format: ScreenshotFormat = "png",
+    quality: float = Query(0.85, gt=0, le=1),
+):
+    """Set the camera view, then return a screenshot of it (see ``/screenshot``)."""
+    await _apply_view(request.view, request.zoom)
+    data, media_type = await _capture_screenshot(format, quality)
+    return Response(content=data, media_type=media_type)
+
+
+async def _apply_view(view: str, zoom: float) -> bool:
+    """Broadcast a camera view; return True once a browser has rendered it."""
+    request_id = uuid.uuid4().hex
+    fut = asyncio.get_running_loop().create_future()
+    _pending_views[request_id] = fut
+
+    try:
+        await broadcast({
+            "type": "cad_command",
+            "action": "set_view",
+            "view": view,
+            "zoom": zoom,
+            "id": request_id,
+        })
+        if not connected_clients:
+            return False
+        try:
+            await asyncio.wait_for(fut, timeout=VIEW_ACK_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    finally:
+        _pending_views.pop(request_id, None)
+
+
+@router.post("/view/ack")
+async def ack_view(request_id: str = Query(alias="id")):
+    """Browser acknowledgement that a requested view has been rendered."""
+    fut = _pending_views.get(request_id)
+    if fut is None:
+        raise HTTPException(404, "Unknown or expired view request")
+    if not fut.done():
+        fut.set_result(None)
+    return {"success": True}
 
 
 class SelectFacesRequest(BaseModel):
@@ -166,12 +352,11 @@ class SelectFacesRequest(BaseModel):
 @router.post("/select-faces")
 async def select_faces(request: SelectFacesRequest):
     """Select faces in the 3D viewer by ID. Replaces current selection."""
-    from .ws import broadcast
-    await broadcast({"type": "cad_command", "action": "clear_selection"})
     await broadcast({
         "type": "cad_command",
         "action": "select_faces",
         "face_ids": request.face_ids,
+        "replace": True,
     })
     return {"success": True, "face_ids": request.face_ids}
 
@@ -179,8 +364,7 @@ async def select_faces(request: SelectFacesRequest):
 @router.post("/clear-selection")
 async def clear_selection():
     """Clear all face selections in the 3D viewer."""
-    from .ws import broadcast
-    await broadcast({"type": "cad_command", "action": "clear_selection"})
+    await broadcast(_CLEAR_SELECTION)
     return {"success": True}
 
 
@@ -191,7 +375,6 @@ class CreateFeatureRequest(BaseModel):
 @router.post("/create-feature")
 async def create_feature(request: CreateFeatureRequest):
     """Create a named feature from currently selected faces."""
-    from .ws import broadcast
     await broadcast({
         "type": "cad_command",
         "action": "create_feature",
@@ -207,7 +390,6 @@ class DeleteFeatureRequest(BaseModel):
 @router.post("/delete-feature")
 async def delete_feature(request: DeleteFeatureRequest):
     """Delete a named feature."""
-    from .ws import broadcast
     await broadcast({
         "type": "cad_command",
         "action": "delete_feature",
@@ -227,7 +409,6 @@ class DisplayRequest(BaseModel):
 @router.post("/display")
 async def set_display(request: DisplayRequest):
     """Control viewport display settings."""
-    from .ws import broadcast
     payload: dict = {"type": "cad_command", "action": "set_display"}
     if request.xray is not None:
         payload["xray"] = request.xray
@@ -252,14 +433,16 @@ async def export_step(request: ExportRequest):
     # Convert to the format expected by export_named_step
     features_dict = {}
     for name, members in request.features.items():
-        features_dict[name] = [m.model_dump() for m in members]
+        features_dict[name] = [
+            {"face_id": m.face_id, "sub_name": m.sub_name} for m in members
+        ]
 
     tmp_dir = Path(tempfile.mkdtemp())
     original_name = engine.step_path.stem if engine.step_path else "model"
     output_path = tmp_dir / f"{original_name}_named.step"
 
     try:
-        engine.export_named_step(features_dict, output_path)
+        await run_cad(engine.export_named_step, features_dict, output_path)
         return FileResponse(
             path=str(output_path),
             filename=output_path.name,
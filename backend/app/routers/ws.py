@@ -1,29 +1,24 @@
-import json
 import logging
 
+import msgspec
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 from .model import engine
+from ..models.messages import ChatMessage, SystemMessage, WSMessage
 from ..services.ai_agent import AIAgent
+from ..ws_bus import connected_clients, encode_message
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Connected WebSocket clients — used to broadcast model updates from REST uploads
-connected_clients: set[WebSocket] = set()
+# Tagged-union decoder for inbound messages, built once
+_DECODER = msgspec.json.Decoder(WSMessage)
 
-
-async def broadcast(data: dict):
-    """Send a message to all connected WebSocket clients."""
-    dead: list[WebSocket] = []
-    for ws in connected_clients:
-        try:
-            await ws.send_json(data)
-        except Exception:
-            dead.append(ws)
-    for ws in dead:
-        connected_clients.discard(ws)
+# Greeting sent to every new connection, encoded once
+_GREETING = encode_message(SystemMessage(
+    content="Connected to agent-cad server. AI assistant ready.",
+))
 
 
 @router.websocket("/ws")
@@ -33,35 +28,40 @@ async def websocket_endpoint(websocket: WebSocket):
 
     # Closure that sends JSON to this specific websocket connection
     async def send_command(data: dict):
-        await websocket.send_json(data)
+        await websocket.send_bytes(encode_message(data))
 
     # Per-connection agent sharing the global CadEngine
     agent = AIAgent(cad_engine=engine, send_command=send_command)
 
-    await websocket.send_json({
-        "type": "system",
-        "content": "Connected to agent-cad server. AI assistant ready.",
-    })
+    await websocket.send_bytes(_GREETING)
 
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            # Accept text or binary frames; the decoder takes either without
+            # a str/bytes round-trip
+            raw = await websocket.receive()
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000), raw.get("reason"))
+            data = raw.get("bytes")
+            if data is None:
+                data = raw.get("text", "")
+            try:
+                message = _DECODER.decode(data)
+            except msgspec.DecodeError as e:
+                logger.warning("Ignoring invalid WebSocket message: %s", e)
+                continue
 
-            if message.get("type") == "chat":
-                user_text = message.get("content", "")
+            if isinstance(message, ChatMessage):
                 try:
-                    reply = await agent.send_message(user_text)
-                    await websocket.send_json({
-                        "type": "chat",
-                        "role": "assistant",
-                        "content": reply,
-                    })
+                    reply = await agent.send_message(message.content)
+                    await websocket.send_bytes(encode_message(ChatMessage(
+                        role="assistant",
+                        content=reply,
+                    )))
                 except Exception:
                     logger.exception("Agent error")
-                    await websocket.send_json({
-                        "type": "system",
-                        "content": "An error occurred while processing your message. Please try again.",
-                    })
+                    await websocket.send_bytes(encode_message(SystemMessage(
+                        content="An error occurred while processing your message. Please try again.",
+                    )))
     except WebSocketDisconnect:
         connected_clients.discard(websocket)
@@ -1,8 +1,10 @@
 """AI agent backed by Claude for CAD-related conversations with tool use."""
 
+import asyncio
 import json
 import logging
 import os
+from collections import OrderedDict
 from typing import Any, Callable, Awaitable
 
 from anthropic import AsyncAnthropic
@@ -160,6 +162,106 @@ TOOLS = [
     },
 ]
 
+# Tools that only read engine state and may run concurrently. The rest send
+# viewport commands and run one at a time, in the order Claude issued them.
+READ_ONLY_TOOLS = frozenset({"get_model_info", "query_faces"})
+
+# Read-only tool results remembered per agent, keyed on the engine's model
+# and features versions
+TOOL_CACHE_SIZE = 64
+
+# Streamed between the text of successive tool-loop rounds
+ROUND_SEPARATOR = "\n\n"
+
+# Prompt caching: the system prompt and tool schemas never change, so mark
+# them as cache breakpoints. A marker on the last tool caches the whole tools
+# block; send_message adds a third on the latest message each call.
+CACHE_CONTROL = {"type": "ephemeral"}
+CACHED_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": CACHE_CONTROL}]
+CACHED_TOOLS = TOOLS[:-1] + [{**TOOLS[-1], "cache_control": CACHE_CONTROL}]
+
+
+def _with_cache_breakpoint(messages: list[dict]) -> list[dict]:
+    """Return a copy of ``messages`` with a cache breakpoint on the last content block.
+
+    The history itself is left untouched so old breakpoints don't pile up
+    (the API allows at most four).
+    """
+    last = messages[-1]
+    content = last["content"]
+    blocks = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
+# History compaction: once the estimated prompt size passes the budget, turns
+# older than the last few are folded into a single heuristic summary message
+TOKEN_BUDGET = 80_000
+RECENT_KEEP = 12
+SUMMARY_PREFIX = "[Conversation summary]"
+SUMMARY_MAX_CHARS = 4000
+
+
+def _block_text(block: Any) -> str:
+    """Text that a content block (SDK object or dict) contributes to the prompt."""
+    if isinstance(block, dict):
+        block_type, get = block.get("type"), block.get
+    else:
+        block_type, get = block.type, lambda key: getattr(block, key, None)
+    if block_type == "text":
+        return get("text") or ""
+    if block_type == "tool_use":
+        return f"{get('name')}({json.dumps(get('input'))})"
+    if block_type == "tool_result":
+        content = get("content")
+        return content if isinstance(content, str) else json.dumps(content)
+    return ""
+
+
+def _message_text(message: dict) -> str:
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(_block_text(b) for b in content)
+
+
+def _estimate_tokens(messages: list[dict]) -> int:
+    """Rough token count (~4 characters per token)."""
+    return sum(len(_message_text(m)) for m in messages) // 4
+
+
+def _summarize(messages: list[dict]) -> str:
+    """Condense turns into one line per user request, tool call and reply.
+
+    Tool results are dropped; a previous summary at the start is carried over.
+    """
+    lines: list[str] = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            if content.startswith(SUMMARY_PREFIX):
+                lines.extend(content[len(SUMMARY_PREFIX):].strip().splitlines())
+            else:
+                lines.append(f"User: {content[:200]}")
+            continue
+        for block in content:
+            text = _block_text(block)
+            if not isinstance(block, dict) and block.type == "tool_use":
+                lines.append(f"Called {text[:200]}")
+            elif not isinstance(block, dict) and block.type == "text" and text:
+                lines.append(f"Assistant: {text[:200]}")
+
+    # Keep the most recent lines that fit
+    kept: list[str] = []
+    size = 0
+    for line in reversed(lines):
+        size += len(line) + 1
+        if size > SUMMARY_MAX_CHARS:
+            break
+        kept.append(line)
+    return SUMMARY_PREFIX + "\n" + "\n".join(reversed(kept))
+
+
 # Type alias for the callback that sends WS messages to the frontend
 SendCommand = Callable[[dict[str, Any]], Awaitable[None]]
 
@@ -171,24 +273,85 @@ class AIAgent:
         self.cad_engine = cad_engine
         self.send_command = send_command
         self.client = AsyncAnthropic()  # reads ANTHROPIC_API_KEY from env
-        self.conversation_history: list[dict] = []
+        self._history: list[dict] = []
+        self._token_budget = TOKEN_BUDGET
+        self._recent_keep = RECENT_KEEP
+        # asyncio.Lock wakes waiters in FIFO order, preserving command order
+        self._command_lock = asyncio.Lock()
+        self._tool_cache: OrderedDict[tuple, Any] = OrderedDict()
+
+    @property
+    def conversation_history(self) -> list[dict]:
+        """Messages sent to Claude (older turns may be folded into a summary)."""
+        return list(self._history)
+
+    def _compact_history(self) -> None:
+        """Fold older turns into a summary message once over the token budget.
+
+        The cut is made only before a plain user prompt, so tool_use and
+        tool_result blocks always stay paired.
+        """
+        if _estimate_tokens(self._history) <= self._token_budget:
+            return
+
+        def is_prompt(i: int) -> bool:
+            message = self._history[i]
+            return message["role"] == "user" and isinstance(message["content"], str)
+
+        # Latest prompt at or before the recent window; fall back to any later one
+        start = max(len(self._history) - self._recent_keep, 1)
+        cut = next((i for i in range(start, 0, -1) if is_prompt(i)), None)
+        if cut is None:
+            cut = next((i for i in range(start, len(self._history)) if is_prompt(i)), None)
+        if cut is None:
+            return
+
+        summary = _summarize(self._history[:cut])
+        self._history[:cut] = [{"role": "user", "content": summary}]
+        logger.debug("Compacted %d messages into a summary", cut)
 
     async def send_message(self, user_message: str) -> str:
-        """Send a user message, run the tool-use loop, return the final text response."""
-        self.conversation_history.append({"role": "user", "content": user_message})
+        """Send a user message, run the tool-use loop, return the final text response.
+
+        The reply is the text of every round of the loop, exactly as it was
+        streamed as ``chat_delta`` messages.
+        """
+        self._history.append({"role": "user", "content": user_message})
+        # Text streamed so far, one entry per round that produced any
+        rounds: list[str] = []
 
         # Agentic loop: call Claude, execute tools, repeat until end_turn
         while True:
-            response = await self.client.messages.create(
+            self._compact_history()
+            # Stream so the browser can show text while Claude is still generating
+            async with self.client.messages.stream(
                 model=CLAUDE_MODEL,
                 max_tokens=4096,
-                system=SYSTEM_PROMPT,
-                tools=TOOLS,
-                messages=self.conversation_history,
+                system=CACHED_SYSTEM,
+                tools=CACHED_TOOLS,
+                messages=_with_cache_breakpoint(self._history),
+            ) as stream:
+                chunks: list[str] = []
+                async for text in stream.text_stream:
+                    # Set a new round's text apart from the previous round's
+                    if not chunks and rounds:
+                        text = ROUND_SEPARATOR + text
+                    chunks.append(text)
+                    await self.send_command({"type": "chat_delta", "text": text})
+                response = await stream.get_final_message()
+            if chunks:
+                rounds.append("".join(chunks))
+            usage = response.usage
+            logger.debug(
+                "Claude usage: input=%s cache_read=%s cache_write=%s output=%s",
+                usage.input_tokens,
+                usage.cache_read_input_tokens,
+                usage.cache_creation_input_tokens,
+                usage.output_tokens,
             )
 
             # Append assistant response to history
-            self.conversation_history.append(
+            self._history.append(
                 {"role": "assistant", "content": response.content}
             )
 
@@ -200,23 +363,48 @@ class AIAgent:
             if not tool_use_blocks:
                 break
 
-            tool_results = []
-            for tool_block in tool_use_blocks:
-                result = await self._execute_tool(tool_block.name, tool_block.input)
-                tool_results.append(
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": tool_block.id,
-                        "content": json.dumps(result) if isinstance(result, (dict, list)) else str(result),
-                    }
-                )
+            results = await asyncio.gather(
+                *(self._run_tool(b.name, b.input) for b in tool_use_blocks)
+            )
+            tool_results = [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": tool_block.id,
+                    "content": json.dumps(result) if isinstance(result, (dict, list)) else str(result),
+                }
+                for tool_block, result in zip(tool_use_blocks, results)
+            ]
 
             # Append tool results as user message
-            self.conversation_history.append({"role": "user", "content": tool_results})
-
-        # Extract final text response
-        text_parts = [b.text for b in response.content if b.type == "text"]
-        return "\n".join(text_parts) if text_parts else ""
+            self._history.append({"role": "user", "content": tool_results})
+
+        return "".join(rounds)
+
+    async def _run_tool(self, name: str, input_data: dict) -> Any:
+        """Execute a tool, serializing the ones that send viewport commands."""
+        if name in READ_ONLY_TOOLS:
+            return await self._run_cached_tool(name, input_data)
+        async with self._command_lock:
+            return await self._execute_tool(name, input_data)
+
+    async def _run_cached_tool(self, name: str, input_data: dict) -> Any:
+        """Execute a read-only tool, reusing the result of an identical earlier call."""
+        engine = self.cad_engine
+        key = (
+            name,
+            engine.model_version,
+            engine.features_version,
+            json.dumps(input_data, sort_keys=True),
+        )
+        if key in self._tool_cache:
+            self._tool_cache.move_to_end(key)
+            return self._tool_cache[key]
+
+        result = await self._execute_tool(name, input_data)
+        self._tool_cache[key] = result
+        if len(self._tool_cache) > TOOL_CACHE_SIZE:
+            self._tool_cache.popitem(last=False)
+        return result
 
     async def _execute_tool(self, name: str, input_data: dict) -> Any:
         """Execute a tool call and return the result."""
@@ -242,43 +430,22 @@ class AIAgent:
             return {"error": str(e)}
 
     async def _tool_get_model_info(self) -> dict:
-        if self.cad_engine.shape is None:
+        info = self.cad_engine.get_model_info()
+        if info is None:
             return {"error": "No model loaded. Please import a STEP file first."}
-
-        filename = self.cad_engine.step_path.name if self.cad_engine.step_path else "unknown"
-        return {
-            "filename": filename,
-            "num_faces": len(self.cad_engine.faces),
-            "length_unit": self.cad_engine.length_unit,
-            "features": list(self.cad_engine.features.keys()) if self.cad_engine.features else [],
-        }
+        return info
 
     async def _tool_query_faces(self, input_data: dict) -> dict:
         if self.cad_engine.shape is None:
             return {"error": "No model loaded."}
 
-        faces = self.cad_engine.face_metadata
-        results = list(faces)  # copy
-
-        surface_type = input_data.get("surface_type")
-        if surface_type:
-            results = [f for f in results if f["surface_type"] == surface_type]
-
-        min_area = input_data.get("min_area")
-        if min_area is not None:
-            results = [f for f in results if f["area"] >= min_area]
-
-        max_area = input_data.get("max_area")
-        if max_area is not None:
-            results = [f for f in results if f["area"] <= max_area]
-
-        face_ids = input_data.get("face_ids")
-        if face_ids is not None:
-            id_set = set(face_ids)
-            results = [f for f in results if f["id"] in id_set]
-
-        limit = input_data.get("limit", 50)
-        results = results[:limit]
+        results = self.cad_engine.query_faces(
+            surface_type=input_data.get("surface_type"),
+            min_area=input_data.get("min_area"),
+            max_area=input_data.get("max_area"),
+            face_ids=input_data.get("face_ids"),
+            limit=input_data.get("limit", 50),
+        )
 
         return {"count": len(results), "faces": results}
 
@@ -287,15 +454,12 @@ class AIAgent:
         if not face_ids:
             return {"error": "No face IDs provided."}
 
-        # Send commands to frontend
-        await self.send_command({
-            "type": "cad_command",
-            "action": "clear_selection",
-        })
+        # One command that replaces the frontend selection
         await self.send_command({
             "type": "cad_command",
             "action": "select_faces",
             "face_ids": face_ids,
+            "replace": True,
         })
         return {"selected": face_ids, "count": len(face_ids)}
 
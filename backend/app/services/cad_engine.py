@@ -7,8 +7,10 @@ Ported from steplabeler's step_processor.py.
 import math
 import re
 from pathlib import Path
+from typing import Any, Callable
 
 import cadquery as cq
+import numpy as np
 from OCP.TopExp import TopExp_Explorer
 from OCP.TopAbs import TopAbs_FACE, TopAbs_EDGE
 from OCP.GCPnts import GCPnts_TangentialDeflection
@@ -16,6 +18,7 @@ from OCP.BRepAdaptor import BRepAdaptor_Curve, BRepAdaptor_Surface
 from OCP.BRep import BRep_Tool
 from OCP.BRepMesh import BRepMesh_IncrementalMesh
 from OCP.TopLoc import TopLoc_Location
+from OCP.gp import gp_Trsf, gp_TrsfForm
 from OCP.BRepGProp import BRepGProp
 from OCP.GProp import GProp_GProps
 from OCP.GeomAbs import (
@@ -42,6 +45,68 @@ SURFACE_TYPE_NAMES = {
     GeomAbs_OffsetSurface: "offset",
 }
 
+# ADVANCED_FACE entity id and its quoted name
+_ADVANCED_FACE_RE = re.compile(
+    rb"(#(\d+)\s*=\s*ADVANCED_FACE\s*\(\s*'([^']*)')",
+    re.IGNORECASE,
+)
+
+# Length-unit declarations, in priority order: a named conversion unit, an SI
+# metre with a prefix, then a bare SI metre. Matched case-insensitively on the
+# raw STEP bytes in a single scan.
+_UNIT_RE = re.compile(
+    rb"CONVERSION_BASED_UNIT\s*\(\s*'(\w+)'"
+    rb"|SI_UNIT\s*\(\s*\.(\w+)\.\s*,\s*\.METRE\.\s*\)"
+    rb"|SI_UNIT\s*\(\s*\$\s*,\s*\.METRE\.\s*\)",
+    re.IGNORECASE,
+)
+
+# Small integer codes for surface type names, for vectorized filtering
+SURFACE_TYPE_CODES = {
+    name: code for code, name in enumerate([*SURFACE_TYPE_NAMES.values(), "other"])
+}
+
+# Positions closer than this (model units) are merged within a face
+VERTEX_MERGE_TOLERANCE = 1e-6
+
+
+def _merge_coincident_vertices(
+    vertices: np.ndarray,
+    normals: np.ndarray,
+    triangles: np.ndarray,
+    vertex_faces: np.ndarray,
+    eps: float = VERTEX_MERGE_TOLERANCE,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Merge duplicate vertices of the same face (e.g. along periodic seams).
+
+    Vertices are only merged within a face so that face boundaries keep their
+    own normals and per-face vertex colouring stays intact. Normals of merged
+    vertices are averaged.
+    """
+    keys = np.column_stack([vertex_faces, np.round(vertices / eps).astype(np.int64)])
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    summed = np.zeros((len(first), 3))
+    np.add.at(summed, inverse, normals)
+    lengths = np.linalg.norm(summed, axis=1, keepdims=True)
+    merged_normals = np.where(lengths > 0, summed / np.where(lengths > 0, lengths, 1), normals[first])
+
+    return vertices[first], merged_normals, inverse[triangles]
+
+
+def _transform_points(points: np.ndarray, trsf: gp_Trsf) -> np.ndarray:
+    """Apply ``trsf`` to an (N, 3) array, matching ``gp_Pnt.Transform``."""
+    form = trsf.Form()
+    if form == gp_TrsfForm.gp_Identity:
+        return points
+    if form == gp_TrsfForm.gp_Translation:
+        return points + trsf.TranslationPart().Coord()
+    # Rows of the 3x4 matrix (scale included); same operation order as OCCT
+    m = np.array([[trsf.Value(r, c) for c in range(1, 5)] for r in range(1, 4)])
+    x, y, z = points[:, 0:1], points[:, 1:2], points[:, 2:3]
+    return x * m[:, 0] + y * m[:, 1] + z * m[:, 2] + m[:, 3]
+
 
 class CadEngine:
     """Processes STEP files: read, tessellate, extract metadata, export with names."""
@@ -51,17 +116,66 @@ class CadEngine:
         self.faces: list = []
         self.face_metadata: list[dict] = []
         self.step_path: Path | None = None
-        self.step_content: str | None = None
+        self.step_content: bytes | None = None  # raw STEP file bytes
         self.advanced_face_lines: list[dict] = []
         self.length_unit: str = "units"
         self.length_scale: float = 1.0
-        self.features: dict = {}
+        self._features: dict = {}
+        # Bumped whenever the loaded model / the features change; key derived-data caches
+        self._model_version = 0
+        self._features_version = 0
+        self._derived: dict[str, tuple[Any, Any]] = {}
+
+    @property
+    def model_version(self) -> int:
+        """Counter that changes whenever the loaded model changes."""
+        return self._model_version
+
+    @property
+    def features_version(self) -> int:
+        """Counter that changes whenever the feature definitions change."""
+        return self._features_version
+
+    @property
+    def features(self) -> dict:
+        """Named feature definitions synced from the frontend."""
+        return self._features
+
+    @features.setter
+    def features(self, value: dict) -> None:
+        self._features = value
+        self._features_version += 1
+
+    def _cached(self, key: str, build: Callable[[], Any], with_features: bool = False) -> Any:
+        """Return ``build()``, memoized until the loaded model changes.
+
+        With ``with_features`` a feature change invalidates it as well.
+        """
+        version = (self._model_version, self._features_version if with_features else 0)
+        hit = self._derived.get(key)
+        if hit is None or hit[0] != version:
+            hit = (version, build())
+            self._derived[key] = hit
+        return hit[1]
 
     def load_step(self, filepath: str | Path) -> dict:
-        """Load a STEP file and extract topology."""
+        """Load a STEP file and extract topology.
+
+        Runs on the CAD worker while readers keep running on the event loop,
+        so the version is bumped both before and after: anything derived
+        mid-load is keyed on a version that never matches again.
+        """
+        self._model_version += 1
+        try:
+            return self._load_step(filepath)
+        finally:
+            # Invalidate caches even if loading failed part-way
+            self._model_version += 1
+
+    def _load_step(self, filepath: str | Path) -> dict:
         self.step_path = Path(filepath)
 
-        with open(filepath, "r") as f:
+        with open(filepath, "rb") as f:
             self.step_content = f.read()
 
         self._parse_step_entities()
@@ -70,20 +184,25 @@ class CadEngine:
         result = cq.importers.importStep(str(filepath))
         self.shape = result.val()
 
-        self.faces = []
+        faces = []
         explorer = TopExp_Explorer(self.shape.wrapped, TopAbs_FACE)
+        to_face, add_face = TopoDS.Face_s, faces.append
         while explorer.More():
-            face = TopoDS.Face_s(explorer.Current())
-            self.faces.append(face)
+            add_face(to_face(explorer.Current()))
             explorer.Next()
 
-        self.face_metadata = []
-        for i, face in enumerate(self.faces):
-            meta = self._extract_face_metadata(face, i)
-            self.face_metadata.append(meta)
+        # Scratch objects reused across faces rather than allocated per face
+        props = GProp_GProps()
+        bbox = Bnd_Box()
+        adaptor = BRepAdaptor_Surface()
+        extract = self._extract_face_metadata
+        face_metadata = [extract(face, i, props, bbox, adaptor) for i, face in enumerate(faces)]
+
+        # Swap both lists in together so readers never see a half-built one
+        self.faces, self.face_metadata = faces, face_metadata
 
         return {
-            "num_faces": len(self.faces),
+            "num_faces": len(faces),
             "num_step_entities": len(self.advanced_face_lines),
             "length_unit": self.length_unit,
             "length_scale": self.length_scale,
@@ -92,45 +211,49 @@ class CadEngine:
     def _parse_step_entities(self):
         """Find all ADVANCED_FACE entities in the STEP text."""
         self.advanced_face_lines = []
-        pattern = re.compile(
-            r"(#(\d+)\s*=\s*ADVANCED_FACE\s*\(\s*'([^']*)')",
-            re.IGNORECASE,
-        )
-        for match in pattern.finditer(self.step_content):
+        for match in _ADVANCED_FACE_RE.finditer(self.step_content):
             self.advanced_face_lines.append({
                 "entity_id": int(match.group(2)),
-                "name": match.group(3),
-                "start_pos": match.start(),
-                "match_text": match.group(1),
+                "name": match.group(3).decode("utf-8", errors="replace"),
+                # Byte span of the name between the quotes, for export splicing
+                "name_span": match.span(3),
             })
 
     def _parse_length_unit(self):
         """Extract length unit from STEP file."""
-        content = self.step_content.upper()
-
         scale_map = {
             "mm": 1.0, "cm": 0.1, "dm": 0.01, "m": 0.001, "km": 0.000001,
             "in": 1.0 / 25.4, "ft": 1.0 / 304.8,
             "yd": 1.0 / 914.4, "mi": 1.0 / 1609344.0,
         }
 
-        conv_match = re.search(r"CONVERSION_BASED_UNIT\s*\(\s*'(\w+)'", content)
+        # One pass over the file; a conversion unit wins outright, otherwise
+        # keep the first SI declaration of each kind
+        conv_match = si_match = si_base_match = None
+        for match in _UNIT_RE.finditer(self.step_content):
+            if match.group(1):
+                conv_match = match
+                break
+            if match.group(2):
+                si_match = si_match or match
+            else:
+                si_base_match = si_base_match or match
+
         if conv_match:
-            unit_name = conv_match.group(1)
+            unit_name = conv_match.group(1).decode().upper()
             unit_map = {"INCH": "in", "FOOT": "ft", "YARD": "yd", "MILE": "mi"}
             self.length_unit = unit_map.get(unit_name, unit_name.lower())
             self.length_scale = scale_map.get(self.length_unit, 1.0)
             return
 
-        si_match = re.search(r"SI_UNIT\s*\(\s*\.(\w+)\.\s*,\s*\.METRE\.\s*\)", content)
         if si_match:
-            prefix = si_match.group(1)
+            prefix = si_match.group(2).decode().upper()
             prefix_map = {"MILLI": "mm", "CENTI": "cm", "DECI": "dm", "KILO": "km"}
             self.length_unit = prefix_map.get(prefix, "m")
             self.length_scale = scale_map.get(self.length_unit, 1.0)
             return
 
-        if re.search(r"SI_UNIT\s*\(\s*\$\s*,\s*\.METRE\.\s*\)", content):
+        if si_base_match:
             self.length_unit = "m"
             self.length_scale = 0.001
             return
@@ -138,19 +261,31 @@ class CadEngine:
         self.length_unit = "mm"
         self.length_scale = 1.0
 
-    def _extract_face_metadata(self, face, face_id: int) -> dict:
-        """Extract geometric metadata from a TopoDS_Face."""
-        adaptor = BRepAdaptor_Surface(face)
+    def _extract_face_metadata(
+        self,
+        face,
+        face_id: int,
+        props: GProp_GProps,
+        bbox: Bnd_Box,
+        adaptor: BRepAdaptor_Surface,
+    ) -> dict:
+        """Extract geometric metadata from a TopoDS_Face.
+
+        ``props``, ``bbox`` and ``adaptor`` are scratch objects reused between
+        faces.
+        """
+        adaptor.Initialize(face)
         surface_type = SURFACE_TYPE_NAMES.get(adaptor.GetType(), "other")
 
-        props = GProp_GProps()
+        # SurfaceProperties_s reinitializes props itself
         BRepGProp.SurfaceProperties_s(face, props)
         area = props.Mass()
 
         centroid = props.CentreOfMass()
         cx, cy, cz = centroid.X(), centroid.Y(), centroid.Z()
 
-        bbox = Bnd_Box()
+        # BRepBndLib.Add_s enlarges the box, so empty it first
+        bbox.SetVoid()
         BRepBndLib.Add_s(face, bbox)
         xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
 
@@ -171,10 +306,11 @@ class CadEngine:
             cylinder = adaptor.Cylinder()
             radius = round(cylinder.Radius(), 4)
             cyl_axis = cylinder.Axis()
+            cyl_dir = cyl_axis.Direction()
             axis_direction = [
-                round(cyl_axis.Direction().X(), 4),
-                round(cyl_axis.Direction().Y(), 4),
-                round(cyl_axis.Direction().Z(), 4),
+                round(cyl_dir.X(), 4),
+                round(cyl_dir.Y(), 4),
+                round(cyl_dir.Z(), 4),
             ]
             axis_loc = cyl_axis.Location()
             axis_point = [
@@ -212,19 +348,25 @@ class CadEngine:
         return None
 
     def tessellate(self, linear_deflection: float = 0.1, angular_deflection: float = 0.5) -> dict:
-        """Tessellate all faces and return mesh data with face-index mapping."""
+        """Tessellate all faces and return mesh data with face-index mapping.
+
+        Mesh buffers are returned as raw bytes: float32 for vertices, normals
+        and edges, uint32 for triangles and face_ids.
+        """
         if self.shape is None:
             raise ValueError("No STEP file loaded")
 
-        mesh = BRepMesh_IncrementalMesh(
+        # The constructor meshes the shape and stores a triangulation on each
+        # face; calling Perform() again would only re-check every face
+        BRepMesh_IncrementalMesh(
             self.shape.wrapped, linear_deflection, False, angular_deflection, True
         )
-        mesh.Perform()
 
-        all_vertices: list[float] = []
-        all_normals: list[float] = []
-        all_triangles: list[int] = []
-        all_face_ids: list[int] = []
+        face_vertices: list[np.ndarray] = []
+        face_normals: list[np.ndarray] = []
+        face_triangles: list[np.ndarray] = []
+        face_tri_ids: list[np.ndarray] = []
+        vertex_faces: list[np.ndarray] = []
         vertex_offset = 0
 
         for face_id, face in enumerate(self.faces):
@@ -237,75 +379,59 @@ class CadEngine:
             trsf = location.Transformation()
             num_verts = triangulation.NbNodes()
             num_tris = triangulation.NbTriangles()
-
-            for i in range(1, num_verts + 1):
-                node = triangulation.Node(i)
-                node.Transform(trsf)
-                all_vertices.extend([node.X(), node.Y(), node.Z()])
+            reversed_face = face.Orientation() == 1
+
+            # Pull nodes/triangles out once per face, then work on whole arrays
+            node = triangulation.Node
+            verts = _transform_points(
+                np.array([node(i).Coord() for i in range(1, num_verts + 1)], dtype=np.float64).reshape(-1, 3),
+                trsf,
+            )
+            triangle = triangulation.Triangle
+            tris = np.array(
+                [triangle(i).Get() for i in range(1, num_tris + 1)], dtype=np.int64
+            ).reshape(-1, 3) - 1
 
             if triangulation.HasNormals():
-                for i in range(1, num_verts + 1):
-                    normal = triangulation.Normal(i)
-                    if face.Orientation() == 1:
-                        all_normals.extend([-normal.X(), -normal.Y(), -normal.Z()])
-                    else:
-                        all_normals.extend([normal.X(), normal.Y(), normal.Z()])
+                normal = triangulation.Normal
+                normals = np.array(
+                    [normal(i).Coord() for i in range(1, num_verts + 1)], dtype=np.float64
+                ).reshape(-1, 3)
             else:
-                face_verts = []
-                for i in range(1, num_verts + 1):
-                    node = triangulation.Node(i)
-                    node.Transform(trsf)
-                    face_verts.append([node.X(), node.Y(), node.Z()])
-
-                vertex_normals = [[0.0, 0.0, 0.0] for _ in range(num_verts)]
-                for i in range(1, num_tris + 1):
-                    tri = triangulation.Triangle(i)
-                    n1, n2, n3 = tri.Get()
-                    v0, v1, v2 = face_verts[n1 - 1], face_verts[n2 - 1], face_verts[n3 - 1]
-                    e1 = [v1[j] - v0[j] for j in range(3)]
-                    e2 = [v2[j] - v0[j] for j in range(3)]
-                    n = [
-                        e1[1] * e2[2] - e1[2] * e2[1],
-                        e1[2] * e2[0] - e1[0] * e2[2],
-                        e1[0] * e2[1] - e1[1] * e2[0],
-                    ]
-                    for idx in [n1 - 1, n2 - 1, n3 - 1]:
-                        vertex_normals[idx] = [vertex_normals[idx][j] + n[j] for j in range(3)]
-
-                for vn in vertex_normals:
-                    length = (vn[0] ** 2 + vn[1] ** 2 + vn[2] ** 2) ** 0.5
-                    if length > 0:
-                        vn = [vn[j] / length for j in range(3)]
-                    else:
-                        vn = [0.0, 0.0, 1.0]
-                    if face.Orientation() == 1:
-                        all_normals.extend([-vn[0], -vn[1], -vn[2]])
-                    else:
-                        all_normals.extend(vn)
-
-            for i in range(1, num_tris + 1):
-                tri = triangulation.Triangle(i)
-                n1, n2, n3 = tri.Get()
-                if face.Orientation() == 1:
-                    all_triangles.extend([
-                        n1 - 1 + vertex_offset,
-                        n3 - 1 + vertex_offset,
-                        n2 - 1 + vertex_offset,
-                    ])
-                else:
-                    all_triangles.extend([
-                        n1 - 1 + vertex_offset,
-                        n2 - 1 + vertex_offset,
-                        n3 - 1 + vertex_offset,
-                    ])
-                all_face_ids.append(face_id)
+                # Area-weighted vertex normals from the triangle cross products
+                v0, v1, v2 = verts[tris[:, 0]], verts[tris[:, 1]], verts[tris[:, 2]]
+                tri_normals = np.cross(v1 - v0, v2 - v0)
+                normals = np.zeros((num_verts, 3))
+                np.add.at(normals, tris, tri_normals[:, None, :])
+                lengths = np.sqrt((normals ** 2).sum(axis=1, keepdims=True))
+                normals = np.where(
+                    lengths > 0, normals / np.where(lengths > 0, lengths, 1), [0.0, 0.0, 1.0]
+                )
+
+            if reversed_face:
+                normals = -normals
+                tris = tris[:, [0, 2, 1]]
 
+            face_vertices.append(verts)
+            face_normals.append(normals)
+            face_triangles.append(tris + vertex_offset)
+            face_tri_ids.append(np.full(num_tris, face_id, dtype=np.int64))
+            vertex_faces.append(np.full(num_verts, face_id, dtype=np.int64))
             vertex_offset += num_verts
 
-        edge_vertices: list[float] = []
+        vertices, normals, triangles = _merge_coincident_vertices(
+            np.concatenate(face_vertices) if face_vertices else np.empty((0, 3)),
+            np.concatenate(face_normals) if face_normals else np.empty((0, 3)),
+            np.concatenate(face_triangles) if face_triangles else np.empty((0, 3), dtype=np.int64),
+            np.concatenate(vertex_faces) if vertex_faces else np.empty(0, dtype=np.int64),
+        )
+        all_face_ids = np.concatenate(face_tri_ids) if face_tri_ids else np.empty(0, dtype=np.int64)
+
+        edge_segments: list[np.ndarray] = []
         edge_explorer = TopExp_Explorer(self.shape.wrapped, TopAbs_EDGE)
+        to_edge = TopoDS.Edge_s
         while edge_explorer.More():
-            edge = TopoDS.Edge_s(edge_explorer.Current())
+            edge = to_edge(edge_explorer.Current())
             try:
                 curve = BRepAdaptor_Curve(edge)
                 discretizer = GCPnts_TangentialDeflection(
@@ -313,30 +439,113 @@ class CadEngine:
                 )
                 num_points = discretizer.NbPoints()
                 if num_points >= 2:
-                    for i in range(1, num_points):
-                        p1 = discretizer.Value(i)
-                        p2 = discretizer.Value(i + 1)
-                        edge_vertices.extend([
-                            p1.X(), p1.Y(), p1.Z(),
-                            p2.X(), p2.Y(), p2.Z(),
-                        ])
+                    # Each point is fetched once; consecutive pairs become line segments
+                    value = discretizer.Value
+                    pts = np.array(
+                        [value(i).Coord() for i in range(1, num_points + 1)], dtype=np.float32
+                    ).reshape(-1, 3)
+                    segs = np.empty((num_points - 1, 2, 3), dtype=np.float32)
+                    segs[:, 0] = pts[:-1]
+                    segs[:, 1] = pts[1:]
+                    edge_segments.append(segs.reshape(-1))
             except Exception:
                 pass
             edge_explorer.Next()
 
         return {
-            "vertices": all_vertices,
-            "normals": all_normals,
-            "triangles": all_triangles,
-            "face_ids": all_face_ids,
+            "vertices": vertices.astype(np.float32).tobytes(),
+            "normals": normals.astype(np.float32).tobytes(),
+            "triangles": triangles.astype(np.uint32).tobytes(),
+            "face_ids": np.asarray(all_face_ids, dtype=np.uint32).tobytes(),
+            "num_faces": len(self.faces),
+            "edges": (
+                np.concatenate(edge_segments) if edge_segments else np.empty(0, dtype=np.float32)
+            ).tobytes(),
+        }
+
+    def get_model_info(self) -> dict | None:
+        """Return a summary of the loaded model, or None if nothing is loaded.
+
+        Rebuilt only when the model or features change; callers must not modify it.
+        """
+        if self.shape is None:
+            return None
+        return self._cached("model_info", self._build_model_info, with_features=True)
+
+    def _build_model_info(self) -> dict:
+        return {
+            "filename": self.step_path.name if self.step_path else "unknown",
             "num_faces": len(self.faces),
-            "edges": edge_vertices,
+            "length_unit": self.length_unit,
+            "features": list(self.features),
         }
 
     def get_faces_metadata(self) -> list[dict]:
         """Return metadata for all faces."""
         return self.face_metadata
 
+    def get_faces_soa(self) -> dict[str, np.ndarray]:
+        """Return numeric face metadata as structure-of-arrays (one array per field).
+
+        Built once per loaded model; callers must not modify the arrays.
+        """
+        return self._cached("faces_soa", self._build_faces_soa)
+
+    def _build_faces_soa(self) -> dict[str, np.ndarray]:
+        faces = self.face_metadata
+        n = len(faces)
+        vec3 = np.dtype((np.float32, 3))
+        return {
+            "ids": np.fromiter((f["id"] for f in faces), dtype=np.uint32, count=n),
+            "area": np.fromiter((f["area"] for f in faces), dtype=np.float32, count=n),
+            "centroids": np.fromiter((f["centroid"] for f in faces), dtype=vec3, count=n),
+            "normals": np.fromiter((f["normal"] for f in faces), dtype=vec3, count=n),
+            "surface_type": np.fromiter(
+                (SURFACE_TYPE_CODES[f["surface_type"]] for f in faces), dtype=np.uint8, count=n
+            ),
+        }
+
+    def _build_face_filter_arrays(self) -> dict:
+        # Full precision so threshold comparisons match the float metadata.
+        # The metadata list is kept alongside so a query indexes the same
+        # snapshot its arrays were built from, even if a load swaps it out.
+        faces = self.face_metadata
+        n = len(faces)
+        return {
+            "faces": faces,
+            "ids": np.fromiter((f["id"] for f in faces), dtype=np.int64, count=n),
+            "area": np.fromiter((f["area"] for f in faces), dtype=np.float64, count=n),
+            "surface_type": np.fromiter(
+                (SURFACE_TYPE_CODES[f["surface_type"]] for f in faces), dtype=np.uint8, count=n
+            ),
+        }
+
+    def query_faces(
+        self,
+        surface_type: str | None = None,
+        min_area: float | None = None,
+        max_area: float | None = None,
+        face_ids: list[int] | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """Return metadata of faces matching all given filters, in face order."""
+        arrays = self._cached("face_filter", self._build_face_filter_arrays)
+        faces = arrays["faces"]
+        mask = np.ones(len(faces), dtype=bool)
+        if surface_type:
+            code = SURFACE_TYPE_CODES.get(surface_type)
+            if code is None:
+                return []
+            mask &= arrays["surface_type"] == code
+        if min_area is not None:
+            mask &= arrays["area"] >= min_area
+        if max_area is not None:
+            mask &= arrays["area"] <= max_area
+        if face_ids is not None:
+            mask &= np.isin(arrays["ids"], np.asarray(face_ids, dtype=np.int64))
+
+        return [faces[i] for i in np.flatnonzero(mask)[:limit]]
+
     def get_face_metadata(self, face_id: int) -> dict | None:
         """Return metadata for a specific face."""
         if 0 <= face_id < len(self.face_metadata):
@@ -363,18 +572,23 @@ class CadEngine:
         replacements = []
         for face_id, name in face_name_map.items():
             if face_id < len(self.advanced_face_lines):
-                entity = self.advanced_face_lines[face_id]
-                old_text = entity["match_text"]
-                new_text = re.sub(r"'[^']*'", f"'{name}'", old_text, count=1)
-                replacements.append((entity["start_pos"], old_text, new_text))
+                start, end = self.advanced_face_lines[face_id]["name_span"]
+                replacements.append((start, end, name.encode()))
 
-        replacements.sort(key=lambda x: x[0], reverse=True)
+        replacements.sort(key=lambda x: x[0])
 
-        for pos, old_text, new_text in replacements:
-            content = content[:pos] + new_text + content[pos + len(old_text):]
+        # Rebuild the file in one pass, swapping in each name between its quotes
+        chunks = []
+        cursor = 0
+        for start, end, name in replacements:
+            chunks.append(content[cursor:start])
+            chunks.append(name)
+            cursor = end
+        chunks.append(content[cursor:])
+        content = b"".join(chunks)
 
         output_path = Path(output_path)
-        with open(output_path, "w") as f:
+        with open(output_path, "wb") as f:
             f.write(content)
 
         return str(output_path)
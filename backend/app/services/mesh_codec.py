@@ -0,0 +1,69 @@
+"""
+Binary framing for mesh payloads sent to the browser.
+
+Frame layout (little-endian):
+    b"CADM" | uint32 header length | JSON header | zero padding to 4 bytes | buffers
+
+The JSON header carries the regular message fields plus a ``buffers`` map of
+``name -> [dtype, byte_offset, length]``, with offsets relative to the start of
+the (4-byte aligned) buffer section so the browser can wrap each one in a typed
+array without copying.
+"""
+
+import struct
+
+import numpy as np
+import orjson
+
+FRAME_MAGIC = b"CADM"
+FRAME_MEDIA_TYPE = "application/octet-stream"
+
+# Mesh buffers and the dtype each is sent as; the frontend's MeshData type
+# (frontend/src/types/index.ts) mirrors this
+MESH_BUFFERS = {
+    "vertices": np.float32,
+    "normals": np.float32,
+    "triangles": np.uint32,
+    "face_ids": np.uint32,
+    "edges": np.float32,
+}
+
+_DTYPE_CODES = {
+    np.dtype(np.float32): "f32",
+    np.dtype(np.uint32): "u32",
+    np.dtype(np.uint8): "u8",
+}
+
+
+def encode_frame(header: dict, buffers: dict[str, np.ndarray]) -> bytes:
+    """Pack a JSON header and named numpy buffers into one binary frame."""
+    layout = {}
+    chunks = []
+    offset = 0
+    for name, array in buffers.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = [_DTYPE_CODES[array.dtype], offset, int(array.size)]
+        chunks.append(array)
+        offset += array.nbytes
+
+    head = orjson.dumps({**header, "buffers": layout})
+    padding = b"\x00" * (-(8 + len(head)) % 4)
+    return b"".join([FRAME_MAGIC, struct.pack("<I", len(head)), head, padding, *chunks])
+
+
+def encode_mesh_message(message: dict, mesh: dict) -> bytes:
+    """Encode a message carrying tessellation output as a binary frame.
+
+    The header's ``mesh.counts`` (vertices, triangles) is derived from the
+    buffers themselves, so it always matches what the frame carries.
+    """
+    buffers = {
+        name: np.frombuffer(mesh[name], dtype=dtype)
+        for name, dtype in MESH_BUFFERS.items()
+    }
+    counts = {
+        "vertices": buffers["vertices"].size // 3,
+        "triangles": buffers["triangles"].size // 3,
+    }
+    header = {**message, "mesh": {"num_faces": mesh["num_faces"], "counts": counts}}
+    return encode_frame(header, buffers)
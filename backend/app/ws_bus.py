@@ -0,0 +1,50 @@
+"""WebSocket client registry and broadcast.
+
+Kept free of router imports so both REST handlers and the ``/ws`` endpoint
+can import it at module load without a circular dependency.
+"""
+
+import asyncio
+
+import msgspec
+from fastapi import WebSocket
+
+# Connected WebSocket clients — used to broadcast model updates from REST uploads
+connected_clients: set[WebSocket] = set()
+
+# Clients sent to concurrently per broadcast batch; the event loop gets a
+# chance to run other work between batches
+BROADCAST_BATCH_SIZE = 50
+
+
+def encode_message(data: dict | msgspec.Struct) -> bytes:
+    """Encode a message as UTF-8 JSON, ready to send as a binary frame."""
+    return msgspec.json.encode(data)
+
+
+async def broadcast(data: dict | msgspec.Struct | bytes):
+    """Send a message to all connected WebSocket clients concurrently.
+
+    Every frame is sent as binary: dicts/Structs are JSON-encoded first, bytes
+    (pre-encoded JSON or mesh frames) go out as-is. Clients tell the two
+    apart by the mesh frame magic.
+    """
+    # Serialize once; every client is sent the same frame
+    frame = data if isinstance(data, bytes) else encode_message(data)
+
+    async def send(ws: WebSocket) -> WebSocket | None:
+        """Send to one client; return it if the send failed."""
+        try:
+            await ws.send_bytes(frame)
+        except Exception:
+            return ws
+        return None
+
+    clients = list(connected_clients)
+    for start in range(0, len(clients), BROADCAST_BATCH_SIZE):
+        if start:
+            await asyncio.sleep(0)
+        batch = clients[start:start + BROADCAST_BATCH_SIZE]
+        for ws in await asyncio.gather(*(send(ws) for ws in batch)):
+            if ws is not None:
+                connected_clients.discard(ws)
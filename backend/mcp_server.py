@@ -9,18 +9,21 @@ Usage:
     backend/.venv/bin/python backend/mcp_server.py
 """
 
+import asyncio
+import functools
 import math
 import os
 import traceback
 from collections import Counter
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-import time
-
 import cadquery as cq
 import httpx
 import numpy as np
+import orjson
 from fastmcp import FastMCP
+from fastmcp.server.dependencies import get_context
 from fastmcp.utilities.types import Image
 from OCP.Bnd import Bnd_Box
 from OCP.BRepBndLib import BRepBndLib
@@ -41,13 +44,42 @@ from OCP.GeomAbs import (
     GeomAbs_SurfaceOfRevolution,
     GeomAbs_SurfaceOfExtrusion,
     GeomAbs_OffsetSurface,
+    GeomAbs_SurfaceType,
 )
 
-mcp = FastMCP(name="agent-cad")
-
 VIEWER_URL = os.environ.get("CAD_VIEWER_URL", "http://localhost:8000")
 GENERATED_DIR = Path(__file__).parent.parent / "generated"
 
+# Camera views understood by the viewer's set_view command
+VALID_VIEWS = {"front", "back", "left", "right", "top", "bottom", "isometric"}
+
+# A refused or timed-out connection means the viewer isn't running; tools
+# report that from their real request instead of probing /api/health first
+_UNREACHABLE = (httpx.ConnectError, httpx.ConnectTimeout)
+VIEWER_DOWN_ERROR = "Viewer backend is not running at " + VIEWER_URL
+
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP):
+    # One pooled async client for every viewer call, so tool calls reuse an
+    # open connection and independent requests can run concurrently. Each
+    # server run opens its own: the lifespan can run more than once per
+    # process, and a module-level client would stay closed after the first.
+    async with httpx.AsyncClient(
+        base_url=VIEWER_URL,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        timeout=httpx.Timeout(10.0, connect=2.0),
+    ) as client:
+        yield {"client": client}
+
+
+mcp = FastMCP(name="agent-cad", lifespan=_lifespan)
+
+
+def _viewer() -> httpx.AsyncClient:
+    """Return the current server run's viewer client (valid inside a tool call)."""
+    return get_context().lifespan_context["client"]
+
 SURFACE_TYPE_NAMES = {
     GeomAbs_Plane: "planar",
     GeomAbs_Cylinder: "cylindrical",
@@ -61,38 +93,38 @@ SURFACE_TYPE_NAMES = {
     GeomAbs_OffsetSurface: "offset",
 }
 
-
-def _viewer_healthy() -> bool:
-    """Check if the viewer backend is running."""
-    try:
-        resp = httpx.get(f"{VIEWER_URL}/api/health", timeout=2)
-        return resp.status_code == 200
-    except (httpx.ConnectError, httpx.TimeoutException):
-        return False
+# Surface type name for each GeomAbs_SurfaceType value, indexed by the enum
+_SURFACE_TYPE_BY_ENUM = [
+    SURFACE_TYPE_NAMES.get(t, "other") for t in GeomAbs_SurfaceType.__members__.values()
+]
 
 
 def _extract_shape_metadata(shape) -> dict:
     """Extract face counts, surface types, and bounding box from an OCP shape."""
+    # One walk over the faces: tally types by enum value, grow the bounding
+    # box, and sum face areas (names are attached once at the end)
+    counts = [0] * len(_SURFACE_TYPE_BY_ENUM)
+    bbox = Bnd_Box()
+    props = GProp_GProps()
+    adaptor = BRepAdaptor_Surface()
+    total_area = 0.0
     explorer = TopExp_Explorer(shape, TopAbs_FACE)
-    surface_types: list[str] = []
+    to_face = TopoDS.Face_s
     while explorer.More():
-        face = TopoDS.Face_s(explorer.Current())
-        adaptor = BRepAdaptor_Surface(face)
-        stype = SURFACE_TYPE_NAMES.get(adaptor.GetType(), "other")
-        surface_types.append(stype)
+        face = to_face(explorer.Current())
+        adaptor.Initialize(face)
+        counts[adaptor.GetType()] += 1
+        BRepBndLib.Add_s(face, bbox)
+        # SurfaceProperties_s reinitializes props itself
+        BRepGProp.SurfaceProperties_s(face, props)
+        total_area += props.Mass()
         explorer.Next()
 
-    type_counts = dict(Counter(surface_types))
-
-    bbox = Bnd_Box()
-    BRepBndLib.Add_s(shape, bbox)
+    type_counts = {name: n for name, n in zip(_SURFACE_TYPE_BY_ENUM, counts) if n}
     xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
 
-    props = GProp_GProps()
-    BRepGProp.SurfaceProperties_s(shape, props)
-
     return {
-        "num_faces": len(surface_types),
+        "num_faces": sum(counts),
         "surface_types": type_counts,
         "bbox": {
             "x_min": round(xmin, 4),
@@ -105,38 +137,51 @@ def _extract_shape_metadata(shape) -> dict:
             "height": round(ymax - ymin, 4),
             "depth": round(zmax - zmin, 4),
         },
-        "total_surface_area": round(props.Mass(), 4),
+        "total_surface_area": round(total_area, 4),
     }
 
 
-@mcp.tool()
-def execute_cadquery(code: str, filename: str = "generated") -> dict:
-    """Execute CadQuery Python code and optionally push the result to the 3D viewer.
+# Modules preloaded into the namespace of executed CadQuery code
+_EXEC_GLOBALS = {
+    "cq": cq,
+    "math": math,
+    "np": np,
+}
 
-    The code must assign its result to a variable named `result`.
-    The result should be a CadQuery Workplane or an OCP TopoDS_Shape.
 
-    Example:
-        result = cq.Workplane("XY").box(10, 20, 5)
+@functools.lru_cache(maxsize=64)
+def _compile_code(code: str):
+    """Compile user code once; agents often resubmit the same snippet."""
+    return compile(code, "<string>", "exec")
 
-    Args:
-        code: CadQuery Python code to execute. Must assign to `result`.
-        filename: Base name for the output STEP file (without extension).
 
-    Returns:
-        On success: filepath, num_faces, surface_types, bbox, viewer_status
-        On error: error message and traceback for debugging
-    """
-    # Prepare execution namespace
-    namespace = {
-        "cq": cq,
-        "math": math,
-        "np": np,
-    }
+async def _upload_to_viewer(step_path: Path) -> str:
+    """Upload a STEP file to the viewer if it is running; return the viewer status."""
+    try:
+        with open(step_path, "rb") as f:
+            resp = await _viewer().post(
+                "/api/upload",
+                files={"file": (step_path.name, f, "application/octet-stream")},
+                timeout=30,
+            )
+        if resp.status_code == 200:
+            return "uploaded"
+        return f"upload_failed: {resp.status_code} {resp.text[:200]}"
+    except _UNREACHABLE:
+        return "not_running"
+    except Exception as e:
+        return f"upload_error: {e}"
 
-    # Execute the code
+
+def _run_cadquery(code: str, filename: str) -> tuple[object, Path] | dict:
+    """Run user code and export its result as STEP.
+
+    Returns ``(shape, step_path)``, or an error dict for the tool to return.
+    """
+    # Execute the code in a fresh namespace
+    namespace = _EXEC_GLOBALS.copy()
     try:
-        exec(code, namespace)
+        exec(_compile_code(code), namespace)
     except Exception as e:
         return {
             "error": f"Execution error: {type(e).__name__}: {e}",
@@ -179,28 +224,44 @@ def execute_cadquery(code: str, filename: str = "generated") -> dict:
             "traceback": traceback.format_exc(),
         }
 
-    # Extract metadata
-    try:
-        metadata = _extract_shape_metadata(shape)
-    except Exception as e:
-        metadata = {"error": f"Metadata extraction failed: {e}"}
+    return shape, step_path
+
+
+@mcp.tool()
+async def execute_cadquery(code: str, filename: str = "generated") -> dict:
+    """Execute CadQuery Python code and optionally push the result to the 3D viewer.
+
+    The code must assign its result to a variable named `result`.
+    The result should be a CadQuery Workplane or an OCP TopoDS_Shape.
 
-    # Upload to viewer if running
-    viewer_status = "not_running"
-    if _viewer_healthy():
+    Example:
+        result = cq.Workplane("XY").box(10, 20, 5)
+
+    Args:
+        code: CadQuery Python code to execute. Must assign to `result`.
+        filename: Base name for the output STEP file (without extension).
+
+    Returns:
+        On success: filepath, num_faces, surface_types, bbox, viewer_status
+        On error: error message and traceback for debugging
+    """
+    # User code and OCCT work run on a worker thread, off the event loop
+    exported = await asyncio.to_thread(_run_cadquery, code, filename)
+    if isinstance(exported, dict):
+        return exported
+    shape, step_path = exported
+
+    async def extract_metadata() -> dict:
         try:
-            with open(step_path, "rb") as f:
-                resp = httpx.post(
-                    f"{VIEWER_URL}/api/upload",
-                    files={"file": (step_path.name, f, "application/octet-stream")},
-                    timeout=30,
-                )
-            if resp.status_code == 200:
-                viewer_status = "uploaded"
-            else:
-                viewer_status = f"upload_failed: {resp.status_code} {resp.text[:200]}"
+            return await asyncio.to_thread(_extract_shape_metadata, shape)
         except Exception as e:
-            viewer_status = f"upload_error: {e}"
+            return {"error": f"Metadata extraction failed: {e}"}
+
+    # The viewer re-imports and tessellates the uploaded file in its own
+    # process, so upload while we extract metadata here
+    viewer_status, metadata = await asyncio.gather(
+        _upload_to_viewer(step_path), extract_metadata()
+    )
 
     return {
         "filepath": str(step_path),
@@ -209,36 +270,66 @@ def execute_cadquery(code: str, filename: str = "generated") -> dict:
     }
 
 
-@mcp.tool()
-def get_model_info() -> dict:
-    """Get information about the model currently loaded in the 3D viewer.
+# Last /api/faces list and its ETag; revalidated with If-None-Match so an
+# unchanged model costs an empty 304 instead of the full list
+_faces_cache: dict = {"etag": None, "faces": None}
 
-    Returns filename, face count, units, features, surface type summary,
-    and bounding box of the loaded model.
-    """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
 
+async def _fetch_faces() -> list[dict] | dict:
+    """Return the viewer's face metadata list, or an error dict."""
+    headers = {}
+    if _faces_cache["etag"]:
+        headers["If-None-Match"] = _faces_cache["etag"]
     try:
-        resp = httpx.get(f"{VIEWER_URL}/api/faces", timeout=10)
+        resp = await _viewer().get("/api/faces", headers=headers, timeout=10)
+        if resp.status_code == 304:
+            return _faces_cache["faces"]
         if resp.status_code == 404:
             return {"error": "No model loaded in the viewer"}
         resp.raise_for_status()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except httpx.HTTPStatusError as e:
         return {"error": f"API error: {e.response.status_code}"}
     except Exception as e:
         return {"error": str(e)}
 
-    faces = resp.json().get("faces", [])
+    faces = orjson.loads(resp.content).get("faces", [])
+    _faces_cache["etag"] = resp.headers.get("ETag")
+    _faces_cache["faces"] = faces
+    return faces
+
+
+async def _fetch_features() -> dict:
+    """Return the viewer's feature definitions, or {} if they can't be fetched."""
+    try:
+        resp = await _viewer().get("/api/features", timeout=5)
+        if resp.status_code == 200:
+            return orjson.loads(resp.content).get("features", {})
+    except Exception:
+        pass
+    return {}
+
+
+@mcp.tool()
+async def get_model_info() -> dict:
+    """Get information about the model currently loaded in the 3D viewer.
+
+    Returns filename, face count, units, features, surface type summary,
+    and bounding box of the loaded model.
+    """
+    # Faces and features are independent; fetch them concurrently
+    faces, features = await asyncio.gather(_fetch_faces(), _fetch_features())
+    if isinstance(faces, dict):
+        return faces
     type_counts = dict(Counter(f["surface_type"] for f in faces))
 
-    # Compute bounding box from face bounds
-    all_mins = [f["bounds"][:3] for f in faces if f.get("bounds")]
-    all_maxs = [f["bounds"][3:] for f in faces if f.get("bounds")]
+    # Compute bounding box from face bounds: one (N, 6) array, reduced per axis
+    bounds = np.array([f["bounds"] for f in faces if f.get("bounds")], dtype=np.float64)
     bbox = {}
-    if all_mins and all_maxs:
-        mins = [min(v[i] for v in all_mins) for i in range(3)]
-        maxs = [max(v[i] for v in all_maxs) for i in range(3)]
+    if len(bounds):
+        mins = bounds[:, :3].min(axis=0).tolist()
+        maxs = bounds[:, 3:].max(axis=0).tolist()
         bbox = {
             "x_min": mins[0], "y_min": mins[1], "z_min": mins[2],
             "x_max": maxs[0], "y_max": maxs[1], "z_max": maxs[2],
@@ -247,15 +338,6 @@ def get_model_info() -> dict:
             "depth": round(maxs[2] - mins[2], 4),
         }
 
-    # Get features
-    features = {}
-    try:
-        feat_resp = httpx.get(f"{VIEWER_URL}/api/features", timeout=5)
-        if feat_resp.status_code == 200:
-            features = feat_resp.json().get("features", {})
-    except Exception:
-        pass
-
     return {
         "num_faces": len(faces),
         "surface_types": type_counts,
@@ -265,7 +347,7 @@ def get_model_info() -> dict:
 
 
 @mcp.tool()
-def query_faces(
+async def query_faces(
     surface_type: str | None = None,
     min_area: float | None = None,
     max_area: float | None = None,
@@ -283,48 +365,58 @@ def query_faces(
         max_area: Maximum face area.
         limit: Maximum number of faces to return (default 20).
     """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
+    # The viewer filters and truncates, so only matching faces are sent
+    params: dict = {"limit": limit}
+    if surface_type:
+        params["surface_type"] = surface_type
+    if min_area is not None:
+        params["min_area"] = min_area
+    if max_area is not None:
+        params["max_area"] = max_area
 
     try:
-        resp = httpx.get(f"{VIEWER_URL}/api/faces", timeout=10)
+        resp = await _viewer().get("/api/faces", params=params, timeout=10)
         if resp.status_code == 404:
             return {"error": "No model loaded in the viewer"}
         resp.raise_for_status()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except httpx.HTTPStatusError as e:
         return {"error": f"API error: {e.response.status_code}"}
     except Exception as e:
         return {"error": str(e)}
 
-    faces = resp.json().get("faces", [])
-
-    if surface_type:
-        faces = [f for f in faces if f["surface_type"] == surface_type]
-    if min_area is not None:
-        faces = [f for f in faces if f["area"] >= min_area]
-    if max_area is not None:
-        faces = [f for f in faces if f["area"] <= max_area]
-
+    data = orjson.loads(resp.content)
     return {
-        "total_matching": len(faces),
-        "faces": faces[:limit],
-        "truncated": len(faces) > limit,
+        "total_matching": data["total_matching"],
+        "faces": data["faces"],
+        "truncated": data["truncated"],
     }
 
 
+# Screenshots are requested as WebP, a fraction of the PNG size for shaded
+# views; the browser falls back to PNG when it can't encode WebP
+SCREENSHOT_PARAMS = {"format": "webp", "quality": 0.85}
+
+
+def _screenshot_image(resp: httpx.Response) -> Image:
+    """Wrap a screenshot response as an Image in whatever format it came back in."""
+    media_type = resp.headers.get("content-type", "image/png").partition(";")[0]
+    return Image(data=resp.content, format=media_type.removeprefix("image/"))
+
+
 @mcp.tool()
-def get_screenshot() -> Image | dict:
-    """Capture a screenshot of the 3D viewer and return it as a PNG image.
+async def get_screenshot() -> Image | dict:
+    """Capture a screenshot of the 3D viewer and return it as an image.
 
     Requires the viewer backend and a browser with the viewer open.
-    Returns the current viewport as a PNG image."""
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
+    Returns the current viewport as a WebP (or PNG) image."""
     try:
-        resp = httpx.get(f"{VIEWER_URL}/api/screenshot", timeout=10)
+        resp = await _viewer().get("/api/screenshot", params=SCREENSHOT_PARAMS, timeout=10)
         resp.raise_for_status()
-        return Image(data=resp.content, format="png")
+        return _screenshot_image(resp)
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except httpx.TimeoutException:
         return {"error": "Screenshot timed out — is the browser open at localhost:5173?"}
     except httpx.HTTPStatusError as e:
@@ -334,7 +426,7 @@ def get_screenshot() -> Image | dict:
 
 
 @mcp.tool()
-def set_view(
+async def set_view(
     view: str = "front",
     zoom: float = 1.0,
 ) -> dict:
@@ -351,112 +443,142 @@ def set_view(
     Returns:
         Confirmation of the view that was set.
     """
-    valid_views = {"front", "back", "left", "right", "top", "bottom", "isometric"}
-    if view not in valid_views:
-        return {"error": f"Invalid view '{view}'. Must be one of: {', '.join(sorted(valid_views))}"}
-
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
+    if view not in VALID_VIEWS:
+        return {"error": f"Invalid view '{view}'. Must be one of: {', '.join(sorted(VALID_VIEWS))}"}
 
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/view",
+        # The viewer answers once the browser has rendered the new view
+        resp = await _viewer().post(
+            "/api/view",
             json={"view": view, "zoom": zoom},
             timeout=5,
         )
         resp.raise_for_status()
-        # Give the browser time to receive WS, move camera, and render
-        time.sleep(0.5)
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
 
 @mcp.tool()
-def select_faces(face_ids: list[int]) -> dict:
+async def capture(
+    view: str = "isometric",
+    zoom: float = 1.0,
+) -> Image | dict:
+    """Set the camera view and capture a screenshot of it in one step.
+
+    Prefer this over set_view() followed by get_screenshot().
+
+    Args:
+        view: Camera orientation — "front", "back", "left", "right",
+              "top", "bottom", or "isometric".
+        zoom: Zoom multiplier. 1.0 = fit model in view, 2.0 = 2x closer,
+              0.5 = 2x farther. Default 1.0.
+    """
+    if view not in VALID_VIEWS:
+        return {"error": f"Invalid view '{view}'. Must be one of: {', '.join(sorted(VALID_VIEWS))}"}
+
+    try:
+        resp = await _viewer().post(
+            "/api/view-and-capture",
+            params=SCREENSHOT_PARAMS,
+            json={"view": view, "zoom": zoom},
+            timeout=10,
+        )
+        resp.raise_for_status()
+        return _screenshot_image(resp)
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
+    except httpx.TimeoutException:
+        return {"error": "Screenshot timed out — is the browser open at localhost:5173?"}
+    except httpx.HTTPStatusError as e:
+        return {"error": f"Screenshot failed: {e.response.status_code} {e.response.text[:200]}"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@mcp.tool()
+async def select_faces(face_ids: list[int]) -> dict:
     """Select faces in the 3D viewer by ID. Replaces current selection.
 
     Args:
         face_ids: List of face IDs to select (e.g. [0, 1, 2]).
     """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/select-faces",
+        resp = await _viewer().post(
+            "/api/select-faces",
             json={"face_ids": face_ids},
             timeout=5,
         )
         resp.raise_for_status()
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
 
 @mcp.tool()
-def clear_selection() -> dict:
+async def clear_selection() -> dict:
     """Clear all face selections in the 3D viewer."""
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/clear-selection",
+        resp = await _viewer().post(
+            "/api/clear-selection",
             timeout=5,
         )
         resp.raise_for_status()
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
 
 @mcp.tool()
-def create_feature(name: str) -> dict:
+async def create_feature(name: str) -> dict:
     """Create a named feature from the currently selected faces.
 
     Args:
         name: Name for the feature (e.g. "bore_hole", "mounting_face").
     """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/create-feature",
+        resp = await _viewer().post(
+            "/api/create-feature",
             json={"name": name},
             timeout=5,
         )
         resp.raise_for_status()
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
 
 @mcp.tool()
-def delete_feature(name: str) -> dict:
+async def delete_feature(name: str) -> dict:
     """Delete a named feature.
 
     Args:
         name: Name of the feature to delete.
     """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/delete-feature",
+        resp = await _viewer().post(
+            "/api/delete-feature",
             json={"name": name},
             timeout=5,
         )
         resp.raise_for_status()
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
 
 @mcp.tool()
-def set_display(
+async def set_display(
     xray: bool | None = None,
     wireframe: bool | None = None,
     colors: bool | None = None,
@@ -474,9 +596,6 @@ def set_display(
         clip_plane: Set clip plane ("x", "y", "z", or None to disable).
         fit_all: If True, fit the model to the viewport.
     """
-    if not _viewer_healthy():
-        return {"error": "Viewer backend is not running at " + VIEWER_URL}
-
     payload: dict = {}
     if xray is not None:
         payload["xray"] = xray
@@ -490,13 +609,15 @@ def set_display(
         payload["fit_all"] = fit_all
 
     try:
-        resp = httpx.post(
-            f"{VIEWER_URL}/api/display",
+        resp = await _viewer().post(
+            "/api/display",
             json=payload,
             timeout=5,
         )
         resp.raise_for_status()
         return resp.json()
+    except _UNREACHABLE:
+        return {"error": VIEWER_DOWN_ERROR}
     except Exception as e:
         return {"error": str(e)}
 
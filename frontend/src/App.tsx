@@ -9,14 +9,14 @@ const WS_URL =
   "/ws";
 
 export default function App() {
-  const { connected, messages, sendMessage } = useWebSocket(WS_URL);
+  const { connected, messages, draft, sendMessage } = useWebSocket(WS_URL);
 
   return (
     <div className="app">
       <div className="viewport">
         <CadViewer />
       </div>
-      <RightPanel connected={connected} messages={messages} onSend={sendMessage} />
+      <RightPanel connected={connected} messages={messages} draft={draft} onSend={sendMessage} />
     </div>
   );
 }
@@ -15,8 +15,7 @@ export default function CadEdges({ clippingPlanes }: CadEdgesProps) {
     if (!meshData || !meshData.edges.length) return null;
 
     const geo = new THREE.BufferGeometry();
-    const positions = new Float32Array(meshData.edges);
-    geo.setAttribute("position", new THREE.BufferAttribute(positions, 3));
+    geo.setAttribute("position", new THREE.BufferAttribute(meshData.edges, 3));
     return geo;
   }, [meshData]);
 
@@ -32,15 +32,12 @@ export default function CadModel({ clippingPlanes }: CadModelProps) {
     if (!meshData) return null;
 
     const geo = new THREE.BufferGeometry();
-    const positions = new Float32Array(meshData.vertices);
-    const normals = new Float32Array(meshData.normals);
-    const indices = new Uint32Array(meshData.triangles);
+    // Mesh buffers arrive as typed arrays and are uploaded as-is
+    geo.setAttribute("position", new THREE.BufferAttribute(meshData.vertices, 3));
+    geo.setAttribute("normal", new THREE.BufferAttribute(meshData.normals, 3));
+    geo.setIndex(new THREE.BufferAttribute(meshData.triangles, 1));
 
-    geo.setAttribute("position", new THREE.BufferAttribute(positions, 3));
-    geo.setAttribute("normal", new THREE.BufferAttribute(normals, 3));
-    geo.setIndex(new THREE.BufferAttribute(indices, 1));
-
-    const numVertices = positions.length / 3;
+    const numVertices = meshData.vertices.length / 3;
     const colors = new Float32Array(numVertices * 3);
     colors.fill(0.6);
     colorsRef.current = colors;
@@ -55,7 +52,7 @@ export default function CadModel({ clippingPlanes }: CadModelProps) {
   // Apply a color to all vertices of a triangle
   const setTriColor = (
     colors: Float32Array,
-    indices: number[],
+    indices: Uint32Array,
     triIdx: number,
     color: [number, number, number]
   ) => {
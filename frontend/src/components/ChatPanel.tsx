@@ -4,10 +4,12 @@ import type { WSMessage } from "../types";
 interface ChatPanelProps {
   connected: boolean;
   messages: WSMessage[];
+  /** Streamed text of the assistant reply in progress */
+  draft: string;
   onSend: (message: WSMessage) => void;
 }
 
-export function ChatPanel({ connected, messages, onSend }: ChatPanelProps) {
+export function ChatPanel({ connected, messages, draft, onSend }: ChatPanelProps) {
   const [input, setInput] = useState("");
   const [waiting, setWaiting] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
@@ -27,7 +29,7 @@ export function ChatPanel({ connected, messages, onSend }: ChatPanelProps) {
   // Auto-scroll to bottom
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages, waiting]);
+  }, [messages, waiting, draft]);
 
   const handleSubmit = (e: FormEvent) => {
     e.preventDefault();
@@ -52,9 +54,12 @@ export function ChatPanel({ connected, messages, onSend }: ChatPanelProps) {
               {"content" in msg ? msg.content : ""}
             </div>
           ))}
-        {waiting && (
-          <div className="chat-msg assistant thinking">Thinking...</div>
-        )}
+        {waiting &&
+          (draft ? (
+            <div className="chat-msg assistant">{draft}</div>
+          ) : (
+            <div className="chat-msg assistant thinking">Thinking...</div>
+          ))}
         <div ref={messagesEndRef} />
       </div>
 
@@ -9,10 +9,11 @@ type TabId = "features" | "facelist" | "chat";
 interface RightPanelProps {
   connected: boolean;
   messages: WSMessage[];
+  draft: string;
   onSend: (message: WSMessage) => void;
 }
 
-export default function RightPanel({ connected, messages, onSend }: RightPanelProps) {
+export default function RightPanel({ connected, messages, draft, onSend }: RightPanelProps) {
   const [activeTab, setActiveTab] = useState<TabId>("features");
 
   return (
@@ -49,7 +50,7 @@ export default function RightPanel({ connected, messages, onSend }: RightPanelPr
         {activeTab === "features" && <FeaturesPanel />}
         {activeTab === "facelist" && <FaceListPanel />}
         {activeTab === "chat" && (
-          <ChatPanel connected={connected} messages={messages} onSend={onSend} />
+          <ChatPanel connected={connected} messages={messages} draft={draft} onSend={onSend} />
         )}
       </div>
     </div>
@@ -1,6 +1,7 @@
 import { useCallback, useRef } from "react";
 import { useModelStore } from "../store/useModelStore";
-import type { UploadResponse } from "../types";
+import type { UploadError } from "../types";
+import { decodeMeshFrame } from "../utils/frame";
 
 export default function Toolbar() {
   const fileInputRef = useRef<HTMLInputElement>(null);
@@ -33,10 +34,11 @@ export default function Toolbar() {
 
       try {
         const res = await fetch("/api/upload", { method: "POST", body: formData });
-        const data: UploadResponse = await res.json();
-        if (data.success && data.mesh && data.faces && data.info && data.filename) {
-          loadModel(data.mesh, data.faces, data.info, data.filename);
+        if (res.headers.get("content-type")?.startsWith("application/octet-stream")) {
+          const update = decodeMeshFrame(await res.arrayBuffer());
+          loadModel(update.mesh, update.faces, update.info, update.filename);
         } else {
+          const data: UploadError = await res.json();
           console.error("Upload failed:", data.error);
         }
       } catch (err) {
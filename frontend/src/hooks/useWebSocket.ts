@@ -1,7 +1,15 @@
 import { useCallback, useEffect, useRef, useState } from "react";
-import type { WSMessage, CadCommandMessage, CadUpdateMessage } from "../types";
+import type {
+  WSMessage,
+  CadCommandMessage,
+  ChatDeltaMessage,
+  ScreenshotRequestMessage,
+} from "../types";
 import { useModelStore } from "../store/useModelStore";
 import type { ClipPlane } from "../store/useModelStore";
+import { decodeMeshFrame, isFrame } from "../utils/frame";
+
+const textDecoder = new TextDecoder();
 
 function handleCadCommand(msg: CadCommandMessage) {
   const store = useModelStore.getState();
@@ -9,8 +17,13 @@ function handleCadCommand(msg: CadCommandMessage) {
   switch (msg.action) {
     case "select_faces":
       if (msg.face_ids) {
-        for (const id of msg.face_ids) {
-          store.selectFace(id, true); // shift=true to add to selection
+        if (msg.replace) {
+          // Replace the whole selection in one store update
+          store.setSelection(msg.face_ids);
+        } else {
+          for (const id of msg.face_ids) {
+            store.selectFace(id, true); // shift=true to add to selection
+          }
         }
       }
       break;
@@ -46,6 +59,16 @@ function handleCadCommand(msg: CadCommandMessage) {
       if (msg.view) {
         store.setView(msg.view, msg.zoom ?? 1.0);
       }
+      if (msg.id) {
+        // The camera moves on the next frame; ack after the one following it
+        // so the server only answers once the new view is on screen
+        const id = msg.id;
+        requestAnimationFrame(() =>
+          requestAnimationFrame(() => {
+            fetch(`/api/view/ack?id=${encodeURIComponent(id)}`, { method: "POST" });
+          }),
+        );
+      }
       break;
   }
 }
@@ -53,6 +76,8 @@ function handleCadCommand(msg: CadCommandMessage) {
 export function useWebSocket(url: string) {
   const [connected, setConnected] = useState(false);
   const [messages, setMessages] = useState<WSMessage[]>([]);
+  // Assistant text streamed so far for the reply in progress
+  const [draft, setDraft] = useState("");
   const wsRef = useRef<WebSocket | null>(null);
 
   useEffect(() => {
@@ -63,6 +88,7 @@ export function useWebSocket(url: string) {
     function connect() {
       if (cancelled) return;
       ws = new WebSocket(url);
+      ws.binaryType = "arraybuffer";
       wsRef.current = ws;
 
       ws.onopen = () => {
@@ -82,7 +108,25 @@ export function useWebSocket(url: string) {
       };
 
       ws.onmessage = (event) => {
-        const message: WSMessage = JSON.parse(event.data);
+        // The server sends binary frames: either a mesh frame (model update)
+        // or UTF-8 JSON for every other message
+        if (event.data instanceof ArrayBuffer && isFrame(event.data)) {
+          const update = decodeMeshFrame(event.data);
+          const store = useModelStore.getState();
+          store.loadModel(update.mesh, update.faces, update.info, update.filename);
+          return;
+        }
+
+        const message: WSMessage = JSON.parse(
+          event.data instanceof ArrayBuffer ? textDecoder.decode(event.data) : event.data,
+        );
+
+        // Accumulate streamed assistant text until the final chat message arrives
+        if (message.type === "chat_delta") {
+          const { text } = message as ChatDeltaMessage;
+          setDraft((prev) => prev + text);
+          return;
+        }
 
         // Intercept cad_command messages — dispatch to store, don't add to chat
         if (message.type === "cad_command") {
@@ -90,28 +134,27 @@ export function useWebSocket(url: string) {
           return;
         }
 
-        // Handle screenshot requests — capture canvas and POST back
+        // Handle screenshot requests — capture canvas in the requested format
+        // and POST it back, tagged with the request id so the server can match
+        // it to its waiter. toBlob silently falls back to PNG for unsupported
+        // types, so the blob's own type is what we report.
         if (message.type === "screenshot_request") {
+          const { id, format = "png", quality } = message as ScreenshotRequestMessage;
           const canvas = document.querySelector("canvas");
-          if (canvas) {
-            const dataUrl = canvas.toDataURL("image/png");
-            fetch("/api/screenshot", {
+          canvas?.toBlob((blob) => {
+            if (!blob) return;
+            fetch(`/api/screenshot/binary?id=${encodeURIComponent(id)}`, {
               method: "POST",
-              headers: { "Content-Type": "application/json" },
-              body: JSON.stringify({ image: dataUrl }),
+              headers: { "Content-Type": blob.type || "image/png" },
+              body: blob,
             });
-          }
+          }, `image/${format}`, quality);
           return;
         }
 
-        // Handle model updates broadcast from REST uploads (e.g. MCP server)
-        if (message.type === "cad_update") {
-          const update = message as CadUpdateMessage;
-          const store = useModelStore.getState();
-          store.loadModel(update.mesh, update.faces, update.info, update.filename);
-          return;
+        if (message.type === "chat" || message.type === "system") {
+          setDraft("");
         }
-
         setMessages((prev) => [...prev, message]);
       };
     }
@@ -135,5 +178,5 @@ export function useWebSocket(url: string) {
     }
   }, []);
 
-  return { connected, messages, sendMessage };
+  return { connected, messages, draft, sendMessage };
 }
@@ -64,6 +64,7 @@ interface ModelState {
   clearModel: () => void;
   selectFace: (faceId: number, shift: boolean) => void;
   clearSelection: () => void;
+  setSelection: (faceIds: number[]) => void;
   setHoveredFace: (faceId: number) => void;
   toggleMultiSelect: () => void;
   createFeature: (name: string) => { success: boolean; error?: string };
@@ -186,6 +187,8 @@ export const useModelStore = create<ModelState>((set, get) => ({
 
   clearSelection: () => set({ selectedFaces: new Set() }),
 
+  setSelection: (faceIds) => set({ selectedFaces: new Set(faceIds) }),
+
   setHoveredFace: (faceId) => set({ hoveredFace: faceId }),
 
   toggleMultiSelect: () => set((s) => ({ multiSelectMode: !s.multiSelectMode })),
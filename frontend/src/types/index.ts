@@ -6,6 +6,12 @@ export interface ChatMessage {
   content: string;
 }
 
+/** Incremental assistant text, replaced by the final `chat` message. */
+export interface ChatDeltaMessage {
+  type: "chat_delta";
+  text: string;
+}
+
 export interface CadUpdateMessage {
   type: "cad_update";
   mesh: MeshData;
@@ -29,6 +35,7 @@ export interface CadCommandMessage {
   type: "cad_command";
   action: string;
   face_ids?: number[];
+  replace?: boolean; // select_faces: replace the current selection instead of toggling
   name?: string;
   xray?: boolean;
   wireframe?: boolean;
@@ -37,14 +44,19 @@ export interface CadCommandMessage {
   fit_all?: boolean;
   view?: string;
   zoom?: number;
+  id?: string; // set_view: request id to acknowledge once the view is rendered
 }
 
 export interface ScreenshotRequestMessage {
   type: "screenshot_request";
+  id: string;
+  format?: "png" | "webp"; // requested encoding; browsers that can't encode it fall back to PNG
+  quality?: number; // lossy encoder quality in [0, 1]
 }
 
 export type WSMessage =
   | ChatMessage
+  | ChatDeltaMessage
   | CadUpdateMessage
   | DrawingMessage
   | SystemMessage
@@ -53,13 +65,15 @@ export type WSMessage =
 
 // --- CAD model types ---
 
+/** Mesh frame buffers; dtypes follow MESH_BUFFERS in backend/app/services/mesh_codec.py. */
 export interface MeshData {
-  vertices: number[];
-  normals: number[];
-  triangles: number[];
-  face_ids: number[];
+  vertices: Float32Array;
+  normals: Float32Array;
+  triangles: Uint32Array;
+  face_ids: Uint32Array;
   num_faces: number;
-  edges: number[];
+  edges: Float32Array;
+  counts: { vertices: number; triangles: number };
 }
 
 export interface FaceMetadata {
@@ -83,13 +97,10 @@ export interface ModelInfo {
   length_scale: number;
 }
 
-export interface UploadResponse {
-  success: boolean;
-  info: ModelInfo | null;
-  mesh: MeshData | null;
-  faces: FaceMetadata[] | null;
-  filename: string | null;
-  error: string | null;
+/** JSON body of a failed /api/upload (success returns a binary mesh frame). */
+export interface UploadError {
+  success: false;
+  error: string;
 }
 
 export interface FeatureMember {
@@ -0,0 +1,47 @@
+import type { CadUpdateMessage, MeshData } from "../types";
+
+// "CADM" read as a little-endian uint32
+const FRAME_MAGIC = 0x4d444143;
+
+type BufferLayout = Record<string, ["f32" | "u32" | "u8", number, number]>;
+type FrameBuffer = Float32Array | Uint32Array | Uint8Array;
+
+const ARRAY_TYPES = { f32: Float32Array, u32: Uint32Array, u8: Uint8Array };
+
+/** True if a binary payload is a mesh frame produced by backend/app/services/mesh_codec.py. */
+export function isFrame(buffer: ArrayBuffer): boolean {
+  return buffer.byteLength >= 8 && new DataView(buffer).getUint32(0, true) === FRAME_MAGIC;
+}
+
+/** Split a binary frame into its JSON header and typed-array views (no copies). */
+export function decodeFrame(buffer: ArrayBuffer): {
+  header: Record<string, unknown>;
+  buffers: Record<string, FrameBuffer>;
+} {
+  if (!isFrame(buffer)) throw new Error("Not a CAD frame");
+
+  const headerLength = new DataView(buffer).getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+  const dataStart = (8 + headerLength + 3) & ~3;
+
+  const buffers: Record<string, FrameBuffer> = {};
+  for (const [name, [dtype, offset, length]] of Object.entries(header.buffers as BufferLayout)) {
+    buffers[name] = new ARRAY_TYPES[dtype](buffer, dataStart + offset, length);
+  }
+  return { header, buffers };
+}
+
+/** Decode a `cad_update` mesh frame (WebSocket broadcast or /api/upload response). */
+export function decodeMeshFrame(buffer: ArrayBuffer): CadUpdateMessage {
+  const { header, buffers } = decodeFrame(buffer);
+  const mesh: MeshData = {
+    vertices: buffers.vertices as Float32Array,
+    normals: buffers.normals as Float32Array,
+    triangles: buffers.triangles as Uint32Array,
+    face_ids: buffers.face_ids as Uint32Array,
+    edges: buffers.edges as Float32Array,
+    num_faces: (header.mesh as MeshData).num_faces,
+    counts: (header.mesh as MeshData).counts,
+  };
+  return { ...(header as Omit<CadUpdateMessage, "mesh">), mesh };
+}